@@ -2,154 +2,354 @@
 
 from __future__ import division
 
-from datetime import datetime
-import operator
+from collections import OrderedDict
+import heapq
+import time
 
 from heinzel import settings
-from heinzel.core.info import get_inst_info
 
 
-class MRUCacheEntry(object):
-	"""Caution: extremely slow!"""
+class History(dict):
+	"""Record changes to data attributes of Model instances. Maps the
+	column names of changed fields to the values they had when the
+	instance was last saved or loaded.
+	"""
 
-	def __init__(self):
-		self.timestamp = datetime.now()
-		self.accesses = 0
 
-	def __repr__(self):
-		return (u"<%s: timestamp=%s, accesses=%s>" % (self.__class__.__name__,
-										self.timestamp, self.accesses))
+class EvictionPolicy(object):
+	"""Decides which entry of a :class:`PolicyCache` is culled next. The
+	policy only keeps track of the keys (InstanceInfo instances) of the
+	cache, the cached instances are held by the cache itself.
 
-	def __eq__(self, other):
-		return self.timestamp == other.timestamp
+	Subclasses implement :meth:`insert`, :meth:`touch`, :meth:`discard`,
+	:meth:`evict` and :meth:`clear`, each in O(1) or O(log n) time.
+	"""
 
-	def __ne__(self, other):
-		return not self.__eq__(other)
+	# The max_size of the cache using this policy, set by the cache.
+	capacity = None
 
-	def __gt__(self, other):
-		now = datetime.now()
-		self_age = (self.timestamp - now).microseconds
-		other_age = (other.timestamp - now).microseconds
+	def __len__(self):
+		raise NotImplementedError
 
-		return self_age < other_age
+	def __contains__(self, key):
+		raise NotImplementedError
 
-	def __le__(self, other):
-		return not self.__gt__(other)
+	def insert(self, key):
+		"""Start keeping track of *key*."""
 
-	def __lt__(self, other):
-		now = datetime.now()
-		self_age = (self.timestamp - now).microseconds
-		other_age = (other.timestamp - now).microseconds
+		raise NotImplementedError
 
-		return self_age > other_age
+	def touch(self, key):
+		"""*key* has been accessed again."""
 
-	def __ge__(self, other):
-		return not self.__lt__(other)
+		raise NotImplementedError
 
-	def touch(self):
-		self.timestamp = datetime.now()
-		self.accesses += 1
+	def discard(self, key):
+		"""Stop keeping track of *key*."""
 
+		raise NotImplementedError
 
-class History(dict):"Record changes to data attributes of Model instances."
+	def evict(self):
+		"""Stop keeping track of the most expendable key and return it."""
 
+		raise NotImplementedError
 
-class RichComparisonCache(object):
-	"""Takes a type implementing the rich comparisons interface as 
-	entry_class, using it for determining which instances need to be culled.
-	To speed up culling, parameter ‘‘cull_n‘‘ determines how many entries will
-	be culled on every culling step, reducing the overall calls to the cull 
-	method."""
+	def expired(self):
+		"""Return a list of keys to be culled no matter how full the cache
+		is.
+		"""
 
-	def __init__(self, max_size=1000, cull_n=4, entry_class=MRUCacheEntry):
-		self.max_size = max_size
-		self.cull_n = cull_n
-		self.entry_class = entry_class
+		return []
+
+	def clear(self):
+		raise NotImplementedError
+
+
+class LRUPolicy(EvictionPolicy):
+	"""Evicts the least recently used key."""
+
+	def __init__(self):
+		# {key: None, ...}, least recently used first.
+		self._order = OrderedDict()
+
+	def __len__(self):
+		return len(self._order)
+
+	def __contains__(self, key):
+		return key in self._order
+
+	def insert(self, key):
+		self._order[key] = None
+
+	def touch(self, key):
+		del self._order[key]
+		self._order[key] = None
+
+	def discard(self, key):
+		self._order.pop(key, None)
+
+	def evict(self):
+		return self._order.popitem(last=False)[0]
+
+	def clear(self):
+		self._order.clear()
+
+
+class LFUPolicy(EvictionPolicy):
+	"""Evicts the least frequently used key, the least recently inserted or
+	touched one of those if there are several. Keys are kept in a heap,
+	entries made obsolete by :meth:`touch` and :meth:`discard` are skipped
+	on eviction and swept out once they outnumber the live ones.
+	"""
+
+	_REMOVED = object()
+
+	def __init__(self):
+		# [[accesses, tick, key], ...]
+		self._heap = []
+		# {key: entry, ...}
 		self._entries = {}
-		self._instances = {}
+		self._tick = 0
 
-	def __contains__(self, item):
-		return item in self._instances
+	def __len__(self):
+		return len(self._entries)
 
-	def add(self, inst_info):
-		self._instances[inst_info] = inst_info.get_inst()
-		self._entries[inst_info] = self.entry_class()
+	def __contains__(self, key):
+		return key in self._entries
 
-		if self.filling_level() > 1.0:
-			self.cull_expendables()
-		
-	def touch(self, inst_info):
-		return self._entries[inst_info].touch()
+	def _push(self, key, accesses):
+		self._tick += 1
+		entry = self._entries[key] = [accesses, self._tick, key]
+		heapq.heappush(self._heap, entry)
 
-	def remove(self, inst_info):
-		self._entries.pop(inst_info)
-		self._instances.pop(inst_info)
+		if len(self._heap) > 2 * len(self._entries) + 64:
+			self._heap = self._entries.values()
+			heapq.heapify(self._heap)
+
+	def insert(self, key):
+		self._push(key, 1)
+
+	def touch(self, key):
+		entry = self._entries[key]
+		entry[-1] = self._REMOVED
+		self._push(key, entry[0] + 1)
+
+	def discard(self, key):
+		entry = self._entries.pop(key, None)
+		if entry is not None:
+			entry[-1] = self._REMOVED
+
+	def evict(self):
+		while True:
+			key = heapq.heappop(self._heap)[-1]
+			if key is not self._REMOVED:
+				del self._entries[key]
+				return key
 
 	def clear(self):
+		del self._heap[:]
 		self._entries.clear()
-		self._instances.clear()
 
-	def filling_level(self):
-		return len(self._instances) / self.max_size
 
-	def cull_expendables(self):
-		getter = operator.itemgetter(1)
-		sortlist = sorted(self._entries.items(), key=getter)
+class ARCPolicy(EvictionPolicy):
+	"""Adaptive Replacement Cache. Keys accessed once are kept in
+	*self._t1*, keys accessed more than once in *self._t2*. Evicted keys are
+	remembered in the ghost lists *self._b1* and *self._b2*; a cache miss on
+	a ghost shifts the target size *self._p* of *self._t1* towards the list
+	that would have kept the key.
 
-		while self.filling_level() > 1.0:
-			for i in xrange(self.cull_n):
-				self.remove(sortlist[-1][0])
-				sortlist.pop()
+	Ghosts are remembered by (model, primary key), so that no InstanceInfo
+	is kept alive by them.
+	"""
 
+	def __init__(self):
+		self._t1 = OrderedDict()
+		self._t2 = OrderedDict()
+		self._b1 = OrderedDict()
+		self._b2 = OrderedDict()
+		self._p = 0
+
+	def __len__(self):
+		return len(self._t1) + len(self._t2)
+
+	def __contains__(self, key):
+		return key in self._t1 or key in self._t2
+
+	def _ghost(self, key):
+		model_info = getattr(key, "model_info", None)
+		if model_info is None:
+			return key
+		return (model_info.model, key.get_pk_as_key())
+
+	def insert(self, key):
+		ghost = self._ghost(key)
+		c = self.capacity
+
+		if ghost in self._b1:
+			self._p = min(c, self._p + max(len(self._b2) // len(self._b1), 1))
+			del self._b1[ghost]
+			self._t2[key] = None
+		elif ghost in self._b2:
+			self._p = max(0, self._p - max(len(self._b1) // len(self._b2), 1))
+			del self._b2[ghost]
+			self._t2[key] = None
+		else:
+			self._t1[key] = None
 
-class MRUCache(object):
-	def __init__(self, max_size=1000, cull_n=1):
-		"""Caution, setting *cull_n* to something other than 1 is untested.
-		"""
+	def touch(self, key):
+		if key in self._t1:
+			del self._t1[key]
+		else:
+			del self._t2[key]
+		self._t2[key] = None
+
+	def discard(self, key):
+		self._t1.pop(key, None)
+		self._t2.pop(key, None)
+
+	def evict(self):
+		if self._t1 and (len(self._t1) > self._p or not self._t2):
+			key = self._t1.popitem(last=False)[0]
+			self._b1[self._ghost(key)] = None
+		else:
+			key = self._t2.popitem(last=False)[0]
+			self._b2[self._ghost(key)] = None
+
+		c = self.capacity
+		while self._b1 and len(self._t1) + len(self._b1) > c:
+			self._b1.popitem(last=False)
+		while self._b2 and len(self) + len(self._b1) + len(self._b2) > 2 * c:
+			self._b2.popitem(last=False)
+
+		return key
+
+	def clear(self):
+		for l in (self._t1, self._t2, self._b1, self._b2):
+			l.clear()
+		self._p = 0
+
+
+class TTLPolicy(EvictionPolicy):
+	"""Keys expire *ttl* seconds after they were inserted, or, if *sliding*
+	is True, after they were last touched. On overflow the key expiring
+	next is evicted.
+	"""
 
+	def __init__(self, ttl=60.0, sliding=False, clock=time.time):
+		self.ttl = ttl
+		self.sliding = sliding
+		self.clock = clock
+
+		# {key: expiry time, ...}, ordered by expiry time, since *ttl* is
+		# the same for all keys.
+		self._expiries = OrderedDict()
+
+	def __len__(self):
+		return len(self._expiries)
+
+	def __contains__(self, key):
+		return key in self._expiries
+
+	def insert(self, key):
+		self._expiries[key] = self.clock() + self.ttl
+
+	def touch(self, key):
+		if self.sliding:
+			del self._expiries[key]
+			self.insert(key)
+
+	def discard(self, key):
+		self._expiries.pop(key, None)
+
+	def evict(self):
+		return self._expiries.popitem(last=False)[0]
+
+	def expired(self):
+		now = self.clock()
+		keys = []
+		for key, expiry in self._expiries.iteritems():
+			if expiry > now:
+				break
+			keys.append(key)
+		return keys
+
+	def clear(self):
+		self._expiries.clear()
+
+
+class PolicyCache(object):
+	"""Keeps at most *max_size* instances alive, the *policy* deciding which
+	ones to cull on overflow. *cull_n* entries are culled at a time.
+	"""
+
+	def __init__(self, policy, max_size=1000, cull_n=1):
+		self.policy = policy
 		self.max_size = max_size
 		self.cull_n = cull_n
 
+		# {inst_info: instance, ...}
 		self._instances = {}
-		self._order = []
 
 	def __contains__(self, inst_info):
 		return inst_info in self._instances
 
+	@property
+	def max_size(self):
+		return self._max_size
+
+	@max_size.setter
+	def max_size(self, max_size):
+		self._max_size = self.policy.capacity = max_size
+
 	def add(self, inst_info):
-	
-		assert (inst_info.get_inst() is not None), (inst_info.vals,)
-	
-		if inst_info in self._order:
-			self.touch(inst_info)
+		inst = inst_info.get_inst()
+		assert (inst is not None), (inst_info._vars,)
+
+		if inst_info in self._instances:
+			self.policy.touch(inst_info)
 		else:
-			self._order.append(inst_info)
-			self._instances[inst_info] = inst_info.get_inst()
+			self.policy.insert(inst_info)
+
+		self._instances[inst_info] = inst
+
+		for expired in self.policy.expired():
+			self.remove(expired)
 
-			while self.filling_level() > 1.0:
-				for i in xrange(self.cull_n):
-					self.cull_expendables()
+		while self.filling_level() > 1.0:
+			self.cull_expendables()
 
 	def touch(self, inst_info):
-		self._order.append(
-			self._order.pop(self._order.index(inst_info))
-		)
+		self.policy.touch(inst_info)
 
 	def remove(self, inst_info):
-		try:
-			self._order.pop(self._order.index(inst_info))
-			self._instances.pop(inst_info)
-		except:
-			print self.filling_level()
-			print [inf.get_inst() for inf in self._order], self._instances.values()
-			raise
+		self.policy.discard(inst_info)
+		self._instances.pop(inst_info, None)
 
 	def clear(self):
-		del self._order[:]
+		self.policy.clear()
 		self._instances.clear()
 
 	def filling_level(self):
-		return len(self._order) / float(self.max_size)
+		return len(self._instances) / self.max_size
+
+	def cull_expendables(self, n=None):
+		"""Remove the *n* most expendable entries, *n* defaulting to
+		*self.cull_n*.
+		"""
+
+		evict = self.policy.evict
+		pop = self._instances.pop
+
+		for i in xrange(min(n or self.cull_n, len(self._instances))):
+			pop(evict(), None)
+
+
+class MRUCache(PolicyCache):
+	"""Keeps the *max_size* most recently used instances alive."""
+
+	def __init__(self, max_size=1000, cull_n=1):
+		PolicyCache.__init__(self, LRUPolicy(), max_size, cull_n)
 
-	def cull_expendables(self):
-		self.remove(self._order[0])
+	@property
+	def _order(self):
+		return self.policy._order
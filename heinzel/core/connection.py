@@ -4,17 +4,22 @@ except ImportError:
 	from pysqlite2 import dbapi2 as sqlite
 
 import os
+import time
+import threading
 from datetime import datetime
+from functools import wraps
 
 from heinzel import settings
 
 from heinzel.core import utils
+from heinzel.core import signals
 from heinzel.core.exceptions import DatabaseError, \
-					DatabaseSanityError, SQLSyntaxError
+					DatabaseSanityError, SQLSyntaxError, TransactionAborted
 
 
 sqlite.register_adapter(datetime, utils.adapt_datetime_to_string)
 sqlite.register_converter("DATETIME", utils.convert_string_to_datetime)
+sqlite.register_converter("BOOL", lambda s: bool(int(s)))
 
 
 class Table(object):
@@ -37,13 +42,99 @@ class Table(object):
 		return self.columns.index(column)
 
 
+class TableRegistry(dict):
+	"""{tablename: Table, ...} of a database, as introspected at 
+	*schema_version*.
+	"""
+
+	schema_version = None
+
+
+class Transaction(object):
+	"""A block of work on *db* that is committed as a whole on leaving it,
+	or rolled back if it is left by an exception. If *db* is None, the block
+	runs on the Database of the thread entering it, see :func:`connect`. 
+	Transactions nest, each level being a SAVEPOINT. Use it as a context 
+	manager:
+	
+		with connection.transaction():
+			...
+	
+	or as a decorator for functions:
+
+		@connection.transaction
+		def f():
+			...
+
+	If the database rolls back the whole transaction on its own, e.g. on a
+	trigger's RAISE(ROLLBACK), the enclosing blocks are rolled back, too.
+	Those left without an exception raise TransactionAborted.
+	"""
+
+	def __init__(self, db=None):
+		self.db = db
+		# The databases the block was entered on, innermost last.
+		self._entered = []
+
+	def __enter__(self):
+		db = self.db or connect()
+		db.begin()
+		self._entered.append(db)
+		return db
+
+	def __exit__(self, exc_type, exc_value, tb):
+		db = self._entered.pop()
+		try:
+			try:
+				if exc_type is not None or db.is_aborted():
+					db.rollback()
+			finally:
+				db.release()
+		except Exception:
+			# The exception leaving the block tells more about what went
+			# wrong than one on closing the transaction.
+			if exc_type is None:
+				raise
+
+		if exc_type is None and db.is_aborted():
+			raise TransactionAborted()
+		return False
+
+	def __call__(self, func):
+		@wraps(func)
+		def transactional(*args, **kwargs):
+			with Transaction(self.db):
+				return func(*args, **kwargs)
+		return transactional
+
+
 class Database(object):
-	def __init__(self):
-		self.dbname = settings.DBNAME
+	"""A connection to the database *dbname*, defaulting to 
+	settings.DBNAME. The introspected tables are kept in *registries*,
+	which may be shared with other Database instances:
+	{dbname: {tablename: Table, ...}, ...}
+	"""
+
+	def __init__(self, dbname=None, registries=None):
+		self.dbname = dbname or settings.DBNAME
 		self.conn = None
 		self.cursor = None
-		self.table_registry = {}
 		self.verbose = False
+
+		if registries is None:
+			registries = {}
+		self._registries = registries
+		self.table_registry = registries.setdefault(self.dbname, 
+														TableRegistry())
+
+		# Names of the SAVEPOINTs of the open transactions, innermost last.
+		self._savepoints = []
+		# isolation_level of self.conn before the outermost transaction.
+		self._isolation_level = None
+		# Whether the database rolled back the current transaction on its
+		# own.
+		self._aborted = False
+
 		self.connect(commit=False)
 		
 
@@ -59,16 +150,28 @@ class Database(object):
 
 		if dbname is not None:
 			self.dbname = dbname
+		self.table_registry = self._registries.setdefault(self.dbname, 
+														TableRegistry())
 
+		# A Database is used by one thread at a time, but not necessarily
+		# by the thread that opened its connection.
 		self.conn = sqlite.connect(self.dbname, 
-			detect_types=sqlite.PARSE_DECLTYPES)
+			detect_types=sqlite.PARSE_DECLTYPES, check_same_thread=False)
+
+		# Enforce the FOREIGN KEY constraints of databases created by syncdb
+		# with integrity="foreign_keys". Others do not declare any.
+		self.conn.execute("PRAGMA foreign_keys=ON")
 
 		self.cursor = self.conn.cursor()
 		self.register_tables()
 
-	def execute(self, stmt, values=()):
+	def execute(self, stmt, values=(), cursor=None):
+		"""Execute *stmt* with *values* on *cursor*, or on the shared cursor
+		of this database if *cursor* is not given.
+		"""
+
 		try:
-			return self.cursor.execute(stmt, values)
+			return (cursor or self.cursor).execute(stmt, values)
 			
 			# if stmt[:6].lower() in ("select",):
 				# return self.cursor.execute(stmt, values)
@@ -81,7 +184,8 @@ class Database(object):
 		except sqlite.IntegrityError, e:
 			msg = e.args[0].lower()
 			if "foreign key constraint" in msg:
-				raise DatabaseSanityError("A trigger prevents operation on "
+				raise DatabaseSanityError("A trigger or foreign key "
+					"constraint prevents operation on "
 					"the table. If a field is set to null=False, an "
 					"insert/update on this database column must never "
 					"be null. Set null=True on the model and re-create "
@@ -126,10 +230,109 @@ class Database(object):
 			print self.cursor.connection.total_changes
 			raise
 
+	def new_cursor(self):
+		"""Return a cursor which is not shared with other queries."""
+
+		return self.conn.cursor()
+
+	def transaction(self, func=None):
+		"""Return a :class:`Transaction` on this database, or, if *func* is
+		given, *func* wrapped to run in one.
+		"""
+
+		if func is not None:
+			return Transaction(self)(func)
+		return Transaction(self)
+
+	def in_transaction(self):
+		return bool(self._savepoints)
+
+	def get_transaction_depth(self):
+		"""Return the number of open transactions, the innermost one 
+		included.
+		"""
+
+		return len(self._savepoints)
+
+	def is_aborted(self):
+		"""Whether the database rolled back the current, or if there is
+		none, the last transaction on its own.
+		"""
+
+		return self._aborted
+
+	def begin(self):
+		"""Open a transaction, or a nested one inside the current one."""
+
+		if not self._savepoints:
+			# sqlite3 must not open transactions on its own anymore.
+			self._isolation_level = self.conn.isolation_level
+			self.conn.isolation_level = None
+			self._aborted = False
+
+		name = "heinzel_%s" % len(self._savepoints)
+		self.conn.execute("SAVEPOINT %s" % name)
+		self._savepoints.append(name)
+
+	def release(self):
+		"""Close the innermost transaction. Its changes are committed when
+		the outermost transaction is closed.
+		"""
+
+		depth = len(self._savepoints)
+		try:
+			self._execute_on_savepoint("RELEASE SAVEPOINT %s")
+		finally:
+			self._savepoints.pop()
+			if not self._savepoints:
+				self.conn.isolation_level = self._isolation_level
+		self._fire("transaction-post-release", depth)
+
 	def commit(self):
-		self.conn.commit()
+		"""Commit pending changes. Inside a transaction, this does nothing,
+		the changes are committed when the outermost transaction is closed.
+		"""
+
+		if not self._savepoints:
+			self.conn.commit()
+
+	def rollback(self):
+		"""Roll back pending changes, or, inside a transaction, the changes
+		made since the innermost transaction was opened.
+		"""
+
+		if self._savepoints:
+			self._execute_on_savepoint("ROLLBACK TO SAVEPOINT %s")
+			self._fire("transaction-post-rollback", len(self._savepoints))
+		else:
+			self.conn.rollback()
+
+	def _fire(self, signal, depth):
+		# Nothing listens before the Storage has been set up.
+		if signal in signals.registry:
+			signals.fire(signal, db=self, depth=depth)
+
+	def _execute_on_savepoint(self, stmt):
+		"""Execute *stmt* on the SAVEPOINT of the innermost transaction. If
+		the database has rolled back the whole transaction already, the 
+		SAVEPOINTs are opened again, so that the enclosing transactions 
+		still have something to roll back to, and the transaction is 
+		marked as aborted.
+		"""
+
+		try:
+			self.conn.execute(stmt % self._savepoints[-1])
+		except sqlite.OperationalError, e:
+			if "no such savepoint" not in str(e).lower():
+				raise
+			self._aborted = True
+			for name in self._savepoints:
+				self.conn.execute("SAVEPOINT %s" % name)
+			self.conn.execute(stmt % self._savepoints[-1])
 
 	def close(self):
+		del self._savepoints[:]
+		self._aborted = False
 		self.cursor = None
 		self.conn.close()
 		self.conn = None
@@ -139,16 +342,36 @@ class Database(object):
 			return self.cursor.execute(stmt, values)
 
 	def register_tables(self):
-		for t in self.get_db_tablenames():
-			self.table_registry[t] = Table(t, self.get_db_columns_for_table(t))
+		"""Introspect the tables of the database, unless its schema has not
+		changed since the last time.
+		"""
+
+		version = self.get_schema_version()
+		if self.table_registry.schema_version == version:
+			return
+
+		tables = dict((t, Table(t, self.get_db_columns_for_table(t)))
+							for t in self.get_db_tablenames())
+		self.table_registry.update(tables)
+		for t in set(self.table_registry) - set(tables):
+			del self.table_registry[t]
+		self.table_registry.schema_version = version
+
+	def get_schema_version(self):
+		"""The schema version is incremented by sqlite on every change of 
+		the schema.
+		"""
+
+		return self.execute("PRAGMA schema_version").fetchone()[0]
 
 	def get_db_tablenames(self):
 		self.execute("SELECT name FROM sqlite_master WHERE type='table'")
 		return[i[0] for i in self.cursor.fetchall()]
 
 	def get_db_columns_for_table(self, table):
-		self.execute("SELECT * FROM %s" % table)
-		return [i[0] for i in self.cursor.description]
+		rows = self.execute("PRAGMA table_info(\"%s\")" 
+								% table.replace('"', '""')).fetchall()
+		return [row[1] for row in rows]
 
 	def table_exists(self, model):
 		return self.execute(
@@ -179,10 +402,173 @@ class Database(object):
 		print "table `%s` for model `%s` validates." %(model.tablename(), model)
 
 
-db = Database()
+class Pool(object):
+	"""Hands out :class:`Database` instances, each with a connection and 
+	cursor of its own, opening at most *max_size* connections. Checking 
+	out a Database blocks for at most *timeout* seconds when all are in 
+	use. Returned connections are checked for health before they are 
+	handed out again. The introspected tables are shared by all of them.
+	"""
+
+	def __init__(self, max_size=None, timeout=None):
+		self.max_size = max_size or settings.POOL_SIZE
+		if timeout is None:
+			timeout = settings.POOL_TIMEOUT
+		self.timeout = timeout
+
+		# The database new connections are opened to, settings.DBNAME if 
+		# None.
+		self.dbname = None
+
+		# {dbname: {tablename: Table, ...}, ...}
+		self.table_registries = {}
+
+		self._idle = []
+		self._size = 0
+		self._lock = threading.Condition()
+		self._local = threading.local()
+
+	def is_healthy(self, db):
+		if db.conn is None or db.dbname != (self.dbname or settings.DBNAME):
+			return False
+		try:
+			db.conn.execute("SELECT 1")
+		except sqlite.Error:
+			return False
+		return True
+
+	def checkout(self):
+		"""Return a Database that is not used by anybody else."""
+
+		deadline = time.time() + self.timeout
+
+		with self._lock:
+			while True:
+				while self._idle:
+					db = self._idle.pop()
+					if self.is_healthy(db):
+						return db
+					self._discard(db)
+
+				if self._size < self.max_size:
+					self._size += 1
+					break
+
+				remaining = deadline - time.time()
+				if remaining <= 0:
+					raise DatabaseError("All %s connections of the pool are "
+						"in use." % self.max_size)
+				self._lock.wait(remaining)
+
+		try:
+			return Database(self.dbname, self.table_registries)
+		except:
+			with self._lock:
+				self._size -= 1
+				self._lock.notify()
+			raise
+
+	def checkin(self, db):
+		"""Give back *db*, which was checked out before. Any open 
+		transaction and uncommitted changes of *db* are rolled back.
+		"""
+
+		if db.conn is not None:
+			try:
+				while db.in_transaction():
+					db.rollback()
+					db.release()
+				db.rollback()
+			except sqlite.Error:
+				db.close()
+
+		with self._lock:
+			if db.conn is None:
+				self._size -= 1
+			else:
+				self._idle.append(db)
+			self._lock.notify()
+
+	def _discard(self, db):
+		if db.conn is not None:
+			try:
+				db.close()
+			except sqlite.Error:
+				pass
+		self._size -= 1
+
+	def get(self):
+		"""Return the Database of the calling thread, checking one out on 
+		the thread's first call. It is checked in again by :meth:`release`
+		or when the thread ends.
+		"""
+
+		checkout = getattr(self._local, "checkout", None)
+		if checkout is None:
+			checkout = self._local.checkout = _Checkout(self, self.checkout())
+		return checkout.db
+
+	def release(self):
+		"""Check in the Database of the calling thread."""
+
+		checkout = getattr(self._local, "checkout", None)
+		if checkout is not None:
+			del self._local.checkout
+			checkout.checkin()
+
+
+class _Checkout(object):
+	"""Holds a Database checked out for a thread, checking it in when it is
+	garbage collected with the thread's local data.
+	"""
+
+	def __init__(self, pool, db):
+		self.pool = pool
+		self.db = db
+
+	def checkin(self):
+		db, self.db = self.db, None
+		if db is not None:
+			self.pool.checkin(db)
+
+	def __del__(self):
+		self.checkin()
+
+
+pool = Pool()
 
 
 def connect(dbname=None):
+	"""Return the Database of the calling thread. If *dbname* is given, it
+	is connected to *dbname* anew, and so are connections opened later.
+	"""
+
+	db = pool.get()
+	if dbname:
+		pool.dbname = dbname
 	if dbname or db.conn is None:
 		db.connect(dbname)
 	return db
+
+
+def release():
+	"""Give the Database of the calling thread back to the pool. Threads 
+	serving requests should call this when a request is done.
+	"""
+
+	pool.release()
+
+
+def transaction(func=None):
+	"""Return a :class:`Transaction` on the Database of the thread entering
+	it, or, if *func* is given, *func* wrapped to run in one.
+	"""
+
+	if func is not None:
+		return Transaction()(func)
+	return Transaction()
+
+
+# The Database of the importing thread. Other threads get their own from 
+# connect().
+db = connect()
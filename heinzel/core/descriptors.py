@@ -81,11 +81,22 @@ class DataFieldDescriptor(object):
 		if inst is None:
 			raise Exception("no access of %s via class!" %self)
 
-		return get_inst_info(inst).get(self.name)
+		inf = get_inst_info(inst)
+		if inf._deferred:
+			column = inf.model_info.field_to_col_names[self.name]
+			if column in inf._deferred and column not in inf._vars:
+				signals.fire("model-load-deferred", instance=inst)
+		return inf.get(self.name)
 
 	def __set__(self, inst, val):
 		inst_info = get_inst_info(inst)
 
+		if inst_info._deferred:
+			# The saved value of a deferred column is not known.
+			column = inst_info.model_info.field_to_col_names[self.name]
+			if column in inst_info._deferred and column not in inst_info._vars:
+				inst_info.mark_changed([column])
+
 		if inst_info._meta["track-changes"]:
 			signals.fire("model-pre-update", instance=inst,
 						value=inst_info.get(self.name), fieldname=self.name)
@@ -111,6 +122,17 @@ class RelationDescriptor(object):
 		if inst is None:
 			raise Exception("no access of %s via class!" %self)
 
+		# An instance selected with select_related, as long as the foreign 
+		# key still points to it.
+		inf = get_inst_info(inst)
+		if self.identifier in inf._related:
+			related = inf._related[self.identifier]
+			pk = inf.get(type(inst).fields()[self.identifier].column_name)
+			if ((related is None and pk is None) 
+					or (related is not None and related.pk == pk)):
+				return related
+			del inf._related[self.identifier]
+
 		mngr = self.relation.get_manager_for_instance(inst, self.identifier)
 
 		if ((self.relation.mode == FK
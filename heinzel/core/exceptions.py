@@ -21,6 +21,11 @@ class SQLSyntaxError(DatabaseError):
 	msg = "SQL statement somehow malformed."
 
 
+class TransactionAborted(DatabaseError):
+	msg = ("The database rolled back the whole transaction, e.g. because "
+			"a trigger raised ROLLBACK.")
+
+
 class DoesNotExist(BaseException):
 	def __init__(self, model=None, params=None, msg=None):
 		self.model = model
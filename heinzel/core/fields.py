@@ -12,7 +12,8 @@ from heinzel.core import utils
 __all__ = ["Field", "TextField", "BufferField", "IntegerField", "BooleanField",
 	"FloatField", "DatetimeField", "LongField", "RegexField", "ISBNField", 
 	"IPv6Field", "HostNameField", "FilePathField", "ImagePathField", 
-	"RelationField", "ForeignKeyField", "ManyToManyField", "OneToOneField"]
+	"RelationField", "ForeignKeyField", "ManyToManyField", "OneToOneField",
+	"Index"]
 
 
 class Field(object):
@@ -25,7 +26,7 @@ class Field(object):
 
 	def __init__(self, initial=None, primary_key=False, auto_increment=False, 
 				null=True, default=None, unique=False, max_length=None, 
-				column_name="", db_default=None):
+				column_name="", db_default=None, index=False):
 
 		self.initial = initial
 		self.primary_key = primary_key
@@ -35,6 +36,8 @@ class Field(object):
 		self.unique = unique
 		self.max_length = max_length
 		self.column_name = column_name
+		# Whether syncdb creates an index on the column.
+		self.index = index
 
 		# To be set on Model construction, will be overwritten with the 
 		# identifier's name for the Field in the Model definition.
@@ -299,3 +302,33 @@ class OneToOneField(RelationField):
 
 	def set_related_name(self, model):
 		self.related_name = self.related_name or model.__name__.lower()
+
+
+class Index(object):
+	"""An index on the columns of the Fields named *fields*, created by 
+	syncdb if declared in the `indexes` of a Model's Meta class:
+
+		class Meta:
+			indexes = (Index("lastname", "firstname"),
+						Index("age", where="age >= 18", name="adults"))
+
+	Keyword arguments are *name*, defaulting to one made up of the table 
+	and column names, *unique*, and *where*, the SQL condition of a 
+	partial index.
+	"""
+
+	def __init__(self, *fields, **kwargs):
+		if not fields:
+			raise TypeError("An Index needs at least one field.")
+
+		self.fields = fields
+		self.name = kwargs.pop("name", "")
+		self.unique = kwargs.pop("unique", False)
+		self.where = kwargs.pop("where", None)
+
+		if kwargs:
+			raise TypeError("Unexpected keyword arguments for Index: %s." 
+														% ", ".join(kwargs))
+
+	def __str__(self):
+		return "<%s %s>" % (self.__class__.__name__, ", ".join(self.fields))
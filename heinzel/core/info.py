@@ -4,8 +4,10 @@ Store information about a Model instance, to be used as cache key.
 """
 
 from weakref import ref
+from itertools import izip
 
 from heinzel.core import signals
+from heinzel.core.cache import History
 
 
 def get_inst_info(inst):
@@ -36,13 +38,77 @@ class ModelInfo(object):
 		self.field_to_col_names["pk"] = self.field_to_col_names[self.pkname]
 		self.db_columns = self.field_to_col_names.values()
 
+		# {(column_name, ...): loader function, ...}
+		self.loaders = {}
+
+	def get_loader(self, columns):
+		"""Return a function that makes a model instance from a database row
+		holding values for *columns*, in that order. The loader is compiled
+		once per column layout.
+		"""
+
+		columns = tuple(self.field_to_col_names.get(c, c) for c in columns)
+		try:
+			return self.loaders[columns]
+		except KeyError:
+			loader = self.loaders[columns] = _compile_loader(self, columns)
+			return loader
+
+
+def _compile_loader(model_info, columns):
+	"""The loader bypasses Model.__init__, the field descriptors and signals:
+	the row's values are trusted to have been converted to the right types
+	by the database adapter already. It returns a tuple of 
+	(instance, InstanceInfo), the instance is not registered with any Storage.
+	"""
+
+	model = model_info.model
+	new = object.__new__
+
+	def load(row):
+		inst = new(model)
+		inf = new(InstanceInfo)
+		inf._setup(model_info)
+		inf._wref = ref(inst, inf._on_instance_delete)
+		inf._vars.update(izip(columns, row))
+		inf._meta["track-changes"] = True
+		inst.__dict__["_inst_info"] = inf
+		return inst, inf
+
+	return load
+
+
+# Saved value of columns whose saved value is unknown.
+_UNSAVED = object()
+
 
 class InstanceInfo(object):
+	# The columns not selected by the query this instance was loaded by, and
+	# {primary key: InstanceInfo, ...} of the instances loaded along with 
+	# it, whose deferred columns are loaded together, see 
+	# QuerySet.defer.
+	_deferred = frozenset()
+	_deferred_group = None
+
 	def __init__(self, inst):
-		self.model_info = get_model_info(type(inst))
+		self._setup(get_model_info(type(inst)))
 		self.set_inst(inst)
+
+	def _setup(self, model_info):
+		"""Set the attributes of a new InstanceInfo, also used by the loaders
+		of ModelInfo, which bypass __init__.
+		"""
+
+		self.model_info = model_info
 		self._lazypkval = object()
 		self._vars = {}
+		self._history = History()
+		# {foreign key identifier: related instance or None, ...}, as 
+		# selected by QuerySet.select_related.
+		self._related = {}
+		# {relation identifier: ([related instance, ...], generations), ...}
+		# as selected by QuerySet.prefetch_related.
+		self._prefetched = {}
 		self._meta = {
 			# is this really needed?
 			"was-reloaded": False,
@@ -80,6 +146,43 @@ class InstanceInfo(object):
 		except KeyError:
 			return alternative
 
+	def record_change(self, name, value):
+		"""Remember *value* as the saved value of field or column *name*,
+		unless an unsaved change of *name* has been recorded already.
+		"""
+
+		name = self.model_info.field_to_col_names.get(name, name)
+		self._history.setdefault(name, value)
+
+	def mark_changed(self, names=None):
+		"""Have the fields or columns *names*, all columns if *names* is 
+		None, count as changed, whatever their values.
+		"""
+
+		if names is None:
+			names = self.model_info.db_columns
+		for name in names:
+			name = self.model_info.field_to_col_names.get(name, name)
+			self._history[name] = _UNSAVED
+
+	def get_changed_columns(self):
+		"""Return a list of the names of the non-primary key columns whose
+		values differ from the saved ones. If changes are not being tracked,
+		all columns are returned, except deferred ones not loaded yet.
+		"""
+
+		pkcol = self.model_info.pkcol
+		if not self._meta.get("track-changes"):
+			deferred = self._deferred
+			return [c for c in self.model_info.db_columns if c != pkcol 
+							and (c not in deferred or c in self._vars)]
+
+		return [c for c, value in self._history.iteritems()
+				if c != pkcol and self._vars.get(c) != value]
+
+	def reset_history(self):
+		self._history.clear()
+
 	def get_pk_as_key(self):
 		return self.get("pk", self._lazypkval)
 
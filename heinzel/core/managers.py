@@ -1,5 +1,8 @@
-﻿from heinzel.core import signals
-from heinzel.core.queries import QuerySet
+﻿from heinzel import settings
+from heinzel.core import signals, connection
+from heinzel.core.queries import QuerySet, storage
+from heinzel.core.info import get_inst_info
+from heinzel.core.sql.dml import BulkInsertQuery, UpsertQuery, BulkUpsertQuery
 from heinzel.core.exceptions import DoesNotExist, MultipleEntriesError
 
 
@@ -53,6 +56,185 @@ class Manager(object):
 	def create(self, **kwargs):
 		return self.model(**kwargs).save()
 
+	def bulk_create(self, instances, batch_size=None):
+		"""INSERT the unsaved *instances* of self.model, with one 
+		executemany per *batch_size* instances, in one transaction. The 
+		instances get the primary keys of their rows. ‘‘Model.save‘‘ is not
+		called, the ‘‘model-pre-bulk-save‘‘ and ‘‘model-post-bulk-save‘‘ 
+		signals are fired once for all of them instead.
+		Returns the list of instances.
+		"""
+
+		instances = list(instances)
+		for inst in instances:
+			if not isinstance(inst, self.model):
+				raise TypeError("%r is not an instance of %s." 
+								% (inst, self.model))
+		if not instances:
+			return instances
+
+		batch_size = batch_size or settings.BULK_BATCH_SIZE
+		db = connection.connect()
+
+		signals.fire("model-pre-bulk-save", model=self.model, 
+												instances=instances)
+		with db.transaction():
+			BulkInsertQuery(self.model, instances, db, batch_size).execute()
+		signals.fire("model-post-bulk-save", model=self.model, 
+												instances=instances)
+
+		return instances
+
+	def upsert(self, conflict_fields=None, **kwargs):
+		"""INSERT a row with the values in *kwargs*, or, if a row with the 
+		same values of the unique *conflict_fields* exists, UPDATE that row
+		with them. Columns not in *kwargs* keep their values. 
+		*conflict_fields* defaults to all unique fields. An existing row is
+		updated by a second statement after the INSERT ... ON CONFLICT DO 
+		NOTHING, and looked up by a third one on SQLite older than 3.35. 
+		They run in one transaction, which is why, unlike with 
+		‘‘get_or_create‘‘, no other process can write the row in between. 
+		Returns a tuple of (instance, created), the instance in memory of an
+		updated row being returned if there is one.
+		"""
+
+		columns = self._get_conflict_columns(conflict_fields)
+		inst = self.model(**kwargs)
+		inf = get_inst_info(inst)
+		db = connection.connect()
+
+		signals.fire("model-pre-save", instance=inst)
+		try:
+			with db.transaction():
+				query = UpsertQuery(inst, columns, db, 
+										self._get_written_columns(kwargs))
+				pk, created = query.execute()
+		except Exception:
+			# Otherwise the next query would INSERT the instance.
+			storage.uncache(inf)
+			raise
+
+		existing = self._get_alive(inf, pk, query.update_columns)
+		if existing is not None:
+			return existing, created
+
+		inf[self.model.pk.column_name] = pk
+		signals.fire("model-post-save", instance=inst, created=created)
+		return inst, created
+
+	def bulk_upsert(self, instances, conflict_fields=None, batch_size=None):
+		"""Upsert the *instances* of self.model, see ‘‘upsert‘‘, with one 
+		executemany per *batch_size* instances, in one transaction. As with
+		‘‘save‘‘, all columns of the instances are written. The instances 
+		get the primary keys of their rows. Which rows were created is not 
+		told apart. Returns the list of instances, with the instances in 
+		memory of updated rows in place of those passed for them.
+		"""
+
+		columns = self._get_conflict_columns(conflict_fields)
+		instances = list(instances)
+		for inst in instances:
+			if not isinstance(inst, self.model):
+				raise TypeError("%r is not an instance of %s." 
+								% (inst, self.model))
+			if None in [get_inst_info(inst).get(c) for c in columns]:
+				raise ValueError("%r has no value for all of %s." 
+								% (inst, columns))
+		if not instances:
+			return instances
+
+		batch_size = batch_size or settings.BULK_BATCH_SIZE
+		db = connection.connect()
+
+		signals.fire("model-pre-bulk-save", model=self.model, 
+												instances=instances)
+		with db.transaction():
+			query = BulkUpsertQuery(self.model, instances, columns, db, 
+																batch_size)
+			query.execute()
+
+		saved = []
+		for i, inst in enumerate(instances):
+			inf = get_inst_info(inst)
+			existing = self._get_alive(inf, inst.pk, query.update_columns)
+			if existing is None:
+				saved.append(inst)
+			else:
+				instances[i] = existing
+		signals.fire("model-post-bulk-save", model=self.model, 
+														instances=saved)
+
+		return instances
+
+	def _get_alive(self, inf, pk, columns):
+		"""Return the instance in memory of the row with primary key *pk*,
+		given the values of *columns* written from *inf* in place of the 
+		instance of *inf*, or None if there is no other instance.
+		"""
+
+		existing = storage._alive.get((self.model, pk))
+		if existing is None or existing is inf:
+			return None
+		inst = existing.get_inst()
+		if inst is None:
+			return None
+
+		storage.uncache(inf)
+		storage._alive[(self.model, pk)] = existing
+		for c in columns:
+			existing._vars[c] = inf._vars.get(c)
+			existing._history.pop(c, None)
+		storage.changed(self.model)
+		return inst
+
+	def _get_written_columns(self, names):
+		"""Return the column names of those of *names* that are fields or 
+		columns of self.model.
+		"""
+
+		columns = []
+		for name in names:
+			field = (self.model.fields().get(name) 
+						or self.model.get_field_by_column_name(name))
+			if field is not None and field.column_name:
+				columns.append(field.column_name)
+		return columns
+
+	def _get_conflict_columns(self, fields=None):
+		"""Return the column names of *fields*, or of all unique fields of
+		self.model if *fields* is None. Raise ValueError if *fields* are not 
+		the primary key, a unique field or the fields of a unique Index.
+		"""
+
+		if fields is None:
+			columns = sorted(set(f.column_name for f in 
+				self.model.fields().values() 
+					if f.unique and not f.primary_key))
+			if not columns:
+				raise ValueError("%s has no unique fields to upsert by." 
+																% self.model)
+			return columns
+
+		fields = list(fields)
+		columns = []
+		for name in fields:
+			field = self.model.fields().get(name)
+			if field is None or not field.column_name:
+				raise ValueError("%s has no column for '%s'." 
+														% (self.model, name))
+			columns.append(field.column_name)
+
+		# ON CONFLICT needs a PRIMARY KEY or UNIQUE constraint on exactly
+		# these columns.
+		if len(fields) == 1 and (field.unique or field.primary_key):
+			return columns
+		for index in self.model._indexes:
+			if (index.unique and index.where is None 
+					and set(index.fields) == set(fields)):
+				return columns
+		raise ValueError("%s has no unique constraint on %s." 
+												% (self.model, list(fields)))
+
 	def get_or_create(self, **kwargs):		
 		try:
 			return self.get(**kwargs), False
@@ -110,6 +110,9 @@ class ModelBase(type):
 
 		# Has to be set after the other Fields got their column_name and name
 		new_class._fields["pk"] = new_class._fields[new_class._primary_key]
+
+		# Indexes declared in addition to those created for `index=True`
+		new_class._indexes = tuple(getattr(attrs.get("Meta"), "indexes", ()))
 		
 		
 		return new_class
@@ -342,13 +345,13 @@ class Model(object):
 			# self.id = results[0]["id"]
 
 		else:
-			## if it already has an id, try to update it.
-			try:
-				uq = UpdateQuery(self)
+			## if it already has an id, try to update it. Only the changed
+			## columns are written, if none changed there is nothing to do.
+			columns = self._inst_info.get_changed_columns()
+			if columns:
+				uq = UpdateQuery(self, columns=columns)
 				res = uq.execute()
 				uq.commit()
-			except:
-				raise 
 			
 			created = False
 
@@ -1,78 +1,189 @@
 # -*- coding: utf8 -*-
 
 import sys
-from copy import deepcopy
+import threading
 from weakref import WeakValueDictionary
 from operator import itemgetter
+from collections import namedtuple
 import itertools
 
 from heinzel import settings
 from heinzel.core import connection
 from heinzel.core import signals
 from heinzel.core.sql.dml import (
-	SelectQuery, Select, WhereLeaf, Count
+	SelectQuery, Select, WhereLeaf, Count, BulkInsertQuery, BulkUpdateQuery,
+	SelectionUpdateQuery, SelectionDeleteQuery
 )
-from heinzel.core.cache import MRUCache
-from heinzel.core.info import get_inst_info
+from heinzel.core.cache import MRUCache, PolicyCache, EvictionPolicy
+from heinzel.core.info import get_inst_info, get_model_info
 from heinzel.core.exceptions import DoesNotExist
 from heinzel.core.constants import *
 
 
 
 class QuerySetIterator(object):
-	def __init__(self, query, store):
+	"""Streams the results of *query* from the database, *chunk_size* rows
+	at a time. Indexing and slicing with non-negative bounds are turned into
+	a LIMIT/OFFSET on a copy of *query*, so only the requested rows are ever
+	read from the database.
+	"""
+
+	def __init__(self, query, store, chunk_size=None):
 		self.query = query
 		self.store = store
+		self.chunk_size = chunk_size or settings.QUERY_CHUNK_SIZE
 
 	def __getitem__(self, item):
 		if isinstance(item, (int, long)):
+			if item < 0:
+				# The position of the row depends on the size of the result
+				# set, which can't be expressed as an OFFSET.
+				return list(self._gen())[item]
 			return list(self._gen(item, item+1))[0]
 		if isinstance(item, slice):
+			if ((item.start or 0) < 0 or (item.stop or 0) < 0
+					or (item.step or 1) < 0):
+				return list(self._gen())[item]
 			return list(self._gen(item.start, item.stop, item.step))
 
 	def __iter__(self):
 		return iter(self._gen())
 
-	def _gen(self, start=None, stop=None, step=None):
-		start, stop, step = start or 0, stop or sys.maxint, step or 1
-
-		aliases = self.query.get_selection_aliases()
-		pkcol = self.query.model.pk.column_name
-
-		## Save all dirty instances to get consistent results.
-		for obj in self.store._dirty.values():
-			obj.save()
-
-		for row in self.query.execute().fetchall()[start:stop:step]:
-			vars = dict(zip(aliases, row))
-
-			if not (self.query.model, vars[pkcol]) in self.store._alive:
-				inst = self.query.model(**vars)
-				inf = get_inst_info(inst)
+	def with_rows(self):
+		"""Iterate over tuples of (model instance, row) of the query's 
+		result set.
+		"""
+
+		return iter(self._gen(with_rows=True))
+
+	def _gen(self, start=None, stop=None, step=None, with_rows=False):
+		"""Yield model instances for the rows *start* to *stop* (stepping by
+		*step*) of the query's result set, or, if *with_rows* is True, 
+		tuples of (instance, row). *start* and *stop* must not be negative.
+		"""
+
+		query = self.query
+		if start or stop is not None:
+			query = query.clone()
+			query.slice(start, stop)
+
+		aliases = query.get_selection_aliases()
+		pkindex = aliases.index(query.model.pk.column_name)
+
+		model_info = get_model_info(query.model)
+		load = model_info.get_loader(aliases)
+		columns = [model_info.field_to_col_names.get(a, a) for a in aliases]
+
+		# The columns of the models of select_related follow those of 
+		# query.model in each row.
+		# [(path, model, loader, columns, index of pk, start, end), ...]
+		related = []
+		start = len(aliases)
+		for path, model, rel_columns in query.related:
+			end = start + len(rel_columns)
+			related.append((path, model, 
+				get_model_info(model).get_loader(rel_columns), rel_columns,
+				rel_columns.index(model.pk.column_name), start, end))
+			start = end
+
+		## Save the dirty instances this query reads to get consistent
+		## results.
+		self.store.flush(query.get_models(), query.db)
+
+		# Use a cursor of our own, the shared one of the database might be
+		# used for other queries while this generator is suspended.
+		cursor = query.execute(query.db.new_cursor())
+
+		rows = itertools.chain.from_iterable(
+			iter(lambda: cursor.fetchmany(self.chunk_size), [])
+		)
+		if step and step > 1:
+			rows = itertools.islice(rows, None, None, step)
+
+		alive = self.store._alive
+		cache_add = self.store._cache.add
+		lock = self.store._lock
+
+		# {primary key: InstanceInfo, ...} of the instances missing the 
+		# deferred columns, which are loaded for all of them at once.
+		deferred = query.deferred
+		if deferred:
+			group = WeakValueDictionary()
+
+		def get_instance(model, load, columns, pk, row):
+			key = (model, pk)
+
+			with lock:
+				inf = alive.get(key)
+
+				if inf is None:
+					inst, inf = load(row)
+					alive[key] = inf
+				else:
+					inst = inf.get_inst()
+					if inst is None:
+						## The instance info already exists, only the 
+						## instance needs to be made anew.
+						inst = object.__new__(inf.model_info.model)
+						inf.set_inst(inst)
+						inf._meta["was-reloaded"] = True
+					if inf._meta["was-reloaded"] or inf._meta["force-sync"]:
+						changed = inf._history
+						if changed:
+							## Keep the unsaved changes, which another
+							## thread may not have flushed yet.
+							inf._vars.update((c, v) for c, v in
+								itertools.izip(columns, row)
+								if c not in changed)
+						else:
+							inf._vars.update(itertools.izip(columns, row))
+
+				cache_add(inf)
+			return inst, inf
+
+		for row in rows:
+			inst, inf = get_instance(query.model, load, columns, 
+														row[pkindex], row)
+
+			if deferred and not deferred.issubset(inf._vars):
+				inf._deferred = deferred
+				inf._deferred_group = group
+				group[row[pkindex]] = inf
+
+			if related:
+				## Hand the related instances to the instances pointing to
+				## them, so they need not be queried.
+				infs = {(): inf}
+				for path, model, rel_load, rel_columns, i, start, end \
+																in related:
+					parent = infs.get(path[:-1])
+					if parent is None:
+						continue
+
+					rel_row = row[start:end]
+					if rel_row[i] is None:
+						# The foreign key is NULL.
+						parent._related[path[-1]] = None
+						continue
+
+					rel_inst, infs[path] = get_instance(model, rel_load,
+										rel_columns, rel_row[i], rel_row)
+					parent._related[path[-1]] = rel_inst
+
+			if with_rows:
+				yield inst, row
 			else:
-				inf = self.store._alive[(self.query.model, vars[pkcol])]
-				if inf.get_inst() is None:
-					## Initializing a new instance with __init__ automatically
-					## sets a new InstanceInfo instance which is not useful 
-					## here, since the instance info already exists.
-					inst = object.__new__(inf.model_info.model)
-					inf.set_inst(inst)
-					inf._meta["was-reloaded"] = True
-				if inf._meta["was-reloaded"] or inf._meta["force-sync"]:
-					inf.update(vars)
-
-			self.store._cache.add(inf)
-			yield inf.get_inst()
+				yield inst
 
 		# Remove any objects in this process that were deleted in other
 		# processes.
 		else:
-			# Delete all self.query.model instances from the cache.
+			# Delete all query.model instances from the cache.
 			# There is probably a more efficient way of cleaning the
 			# cache (more selectively), but it seems not worth the 
 			# effort atm.
 			for m, pk in self.store._alive.keys():
-				if isinstance(m, self.query.model):
+				if isinstance(m, query.model):
 					inf = self.store._alive[(m, pk)]
 					if inf.get_inst() is not None:
 						signals.fire("model-pre-delete", inf.get_inst(), True)
@@ -80,19 +191,79 @@ class QuerySetIterator(object):
 			
 
 
+class ValuesListIterator(object):
+	"""Streams the rows of *query* from the database as tuples, *chunk_size*
+	rows at a time, without making any model instances. If *flat* is True,
+	the values of the only column selected are yielded instead, if *named* 
+	is True, namedtuples with the attributes *fields*.
+	"""
+
+	def __init__(self, query, store, fields, flat=False, named=False, 
+															chunk_size=None):
+		self.query = query
+		self.store = store
+		self.fields = fields
+		self.flat = flat
+		self.named = named
+		self.chunk_size = chunk_size or settings.QUERY_CHUNK_SIZE
+
+	def __iter__(self):
+		query = self.query
+
+		## Save the dirty instances this query reads to get consistent
+		## results.
+		self.store.flush(query.get_models(), query.db)
+
+		cursor = query.db.new_cursor()
+		if self.named:
+			row_class = namedtuple("Row", self.fields, rename=True)
+			cursor.row_factory = lambda cursor, row: row_class._make(row)
+		query.execute(cursor)
+
+		rows = itertools.chain.from_iterable(
+			iter(lambda: cursor.fetchmany(self.chunk_size), [])
+		)
+		if self.flat:
+			return itertools.imap(itemgetter(0), rows)
+		return rows
+
+
 class Storage(object):
+	"""The identity map of the instances in memory, shared by all threads.
+	Unsaved instances and changes are kept per thread, each thread saving
+	only its own on its own connection, see :meth:`flush`.
+	"""
+
 	def __init__(self, cache=None):
 		# {(InstanceInfo(instance).model_info.model, instance.pk): InstanceInfo, ...}}
 		self._alive = WeakValueDictionary()
 
-		# {InstanceInfo(instance): instance, ...}}
-		self._dirty = {}
+		# Holds the {InstanceInfo(instance): instance, ...} of the unsaved
+		# instances of each thread, see _dirty.
+		self._local = threading.local()
+
+		# Guards the changes to self._alive and self._cache that take more
+		# than one step.
+		self._lock = threading.Lock()
 
-		if cache is not None:
+		# *cache* may be a cache or an EvictionPolicy for a PolicyCache.
+		if isinstance(cache, EvictionPolicy):
+			self._cache = PolicyCache(cache, settings.MAX_CACHE)
+		elif cache is not None:
 			self._cache = cache
 		else:
 			self._cache = MRUCache(settings.MAX_CACHE)
 
+		# {model: number of changes to its instances, ...}, for querysets
+		# to tell whether the results they cached are still valid.
+		self._generations = {}
+
+		# {Database: [(transaction depth, InstanceInfo, created, primary 
+		# key before saving, changed columns), ...], ...}, the instances
+		# saved inside open transactions, to be restored if those are 
+		# rolled back.
+		self._saved_in_transaction = {}
+
 		signals.register(
 			(
 				"instance-deleted",
@@ -104,10 +275,13 @@ class Storage(object):
 				"model-post-init",
 				"model-pre-save",
 				"model-post-save",
+				"model-pre-bulk-save",
+				"model-post-bulk-save",
 				"model-pre-delete",
 				"model-post-delete",
 				"model-pre-update",
 				"model-post-update",
+				"model-load-deferred",
 				
 				# "model-history-reset",
 				# "model-history-redo",
@@ -126,34 +300,123 @@ class Storage(object):
 
 				"model-do-cache",
 				"model-do-not-cache",
+
+				"transaction-post-release",
+				"transaction-post-rollback",
 			),
 			self
 		)
 		signals.register_with_callback("cache-rollback", self, "rollback")
 
-	def get(self, query):
-		return QuerySetIterator(query, self)
+	@property
+	def _dirty(self):
+		"""{InstanceInfo(instance): instance, ...} of the instances created
+		or changed by the calling thread and not saved yet.
+		"""
+
+		try:
+			return self._local.dirty
+		except AttributeError:
+			dirty = self._local.dirty = {}
+			return dirty
+
+	def get(self, query, chunk_size=None):
+		return QuerySetIterator(query, self, chunk_size)
 
 	def clear(self):
-		self._dirty.clear()
-		self._alive.clear()
-		self._cache.clear()
+		"""Forget all instances, and the unsaved ones of the calling 
+		thread.
+		"""
+
+		with self._lock:
+			self._dirty.clear()
+			self._alive.clear()
+			self._cache.clear()
+			self._generations.clear()
+			self._saved_in_transaction.clear()
+
+	def changed(self, *models):
+		"""Note that instances of *models* were created, changed or 
+		deleted.
+		"""
+
+		for model in models:
+			self._generations[model] = self._generations.get(model, 0) + 1
+
+	def get_generations(self, models):
+		"""Return a dict mapping each of *models* to the number of changes
+		to its instances so far.
+		"""
+
+		get = self._generations.get
+		return dict((model, get(model, 0)) for model in models)
+
+	def flush(self, models=None, db=None):
+		"""Save the dirty instances of *models*, or of all models if *models*
+		is None, in one transaction. The rows of each model are inserted and
+		updated in batches. ‘‘Model.save‘‘ is not called, but the 
+		‘‘model-pre-save‘‘ and ‘‘model-post-save‘‘ signals are fired. Only
+		the instances created or changed by the calling thread are saved,
+		so that a rollback on another thread's connection does not drop 
+		them.
+		"""
+
+		infs = [inf for inf in self._dirty
+				if models is None or inf.model_info.model in models]
+		if not infs:
+			return
+
+		db = db or connection.connect()
+
+		# {model: ([instance to be inserted, ...], 
+		#	{(changed column, ...): [instance to update, ...], ...})}
+		batches = {}
+		for inf in infs:
+			inst = inf.get_inst()
+			new, old = batches.setdefault(inf.model_info.model, ([], {}))
+			if inst.pk is None:
+				new.append(inst)
+			else:
+				columns = tuple(sorted(inf.get_changed_columns()))
+				old.setdefault(columns, []).append(inst)
+
+		for inf in infs:
+			signals.fire("model-pre-save", instance=inf.get_inst())
+
+		with db.transaction():
+			for model, (new, old) in batches.items():
+				if new:
+					BulkInsertQuery(model, new, db).execute()
+				for columns, insts in old.items():
+					# Instances without changes need not be written.
+					if columns:
+						BulkUpdateQuery(model, insts, db, columns).execute()
+
+		for model, (new, old) in batches.items():
+			for inst in new:
+				signals.fire("model-post-save", instance=inst, created=True)
+			for insts in old.values():
+				for inst in insts:
+					signals.fire("model-post-save", instance=inst, 
+															created=False)
 
 	def set_dirty(self, inst_info):
 		self._dirty[inst_info] = inst_info.get_inst()
 
 	def cache(self, inf):
-		self._alive.pop((inf.model_info.model, inf._lazypkval), None)
-		self._alive[(inf.model_info.model, inf.get_pk_as_key())] = inf
-		self._cache.add(inf)
+		with self._lock:
+			self._alive.pop((inf.model_info.model, inf._lazypkval), None)
+			self._alive[(inf.model_info.model, inf.get_pk_as_key())] = inf
+			self._cache.add(inf)
 
 	def uncache(self, inf):
-		if inf in self._cache:
-			self._cache.remove(inf)
+		with self._lock:
+			if inf in self._cache:
+				self._cache.remove(inf)
 
-		self._dirty.pop(inf, None)
-		self._alive.pop((inf.model_info.model, inf.get_pk_as_key()), None)
-		self._alive.pop((inf.model_info.model, inf._lazypkval), None)
+			self._dirty.pop(inf, None)
+			self._alive.pop((inf.model_info.model, inf.get_pk_as_key()), None)
+			self._alive.pop((inf.model_info.model, inf._lazypkval), None)
 
 	### signals ###
 
@@ -168,11 +431,15 @@ class Storage(object):
 		inf = get_inst_info(instance)
 		signals.fire("start-tracking-changes", instance=instance)
 		self._alive[(inf.model_info.model, inf.get_pk_as_key())] = inf
+		self.changed(inf.model_info.model)
 
 		# If instance was not initialized with a value for primary key,
 		# then it has not been saved yet and goes into self._dirty.
 		if instance.pk is None:
 			self.set_dirty(inf)
+		else:
+			# Which values in the database differ is not known.
+			inf.mark_changed()
 
 	def start_tracking_changes(self, instance):
 		get_inst_info(instance)._meta["track-changes"] = True
@@ -181,10 +448,14 @@ class Storage(object):
 		get_inst_info(instance)._meta["track-changes"] = False
 
 	def model_pre_save(self, instance):
-		pass
+		get_inst_info(instance)._meta["unsaved-pk"] = instance.pk
 
 	def model_post_save(self, instance, created):
 		inf = get_inst_info(instance)
+		self.note_saved(inf, created)
+		inf.reset_history()
+		self.changed(inf.model_info.model)
+
 		if not inf._meta["do-cache"]:
 			return
 
@@ -195,16 +466,122 @@ class Storage(object):
 		# tracking now.
 		signals.fire("start-tracking-changes", instance=instance)
 
+	def model_pre_bulk_save(self, model, instances):
+		for instance in instances:
+			get_inst_info(instance)._meta["unsaved-pk"] = instance.pk
+
+	def model_post_bulk_save(self, model, instances):
+		self.changed(model)
+
+		for instance in instances:
+			inf = get_inst_info(instance)
+			self.note_saved(inf, True)
+			inf.reset_history()
+
+			if inf._meta["do-cache"]:
+				self.cache(inf)
+				self._dirty.pop(inf, None)
+
 	def model_pre_update(self, instance, value, fieldname):
-		# instance._inst_info.record_change(fieldname, value)
-		pass
+		get_inst_info(instance).record_change(fieldname, value)
 
 	def model_post_update(self, instance, value, fieldname):
 		inf = get_inst_info(instance)
+		self.changed(inf.model_info.model)
 
 		if not inf in self._dirty:
 			self.set_dirty(inf)
 
+	def note_saved(self, inf, created):
+		"""Remember that *inf* was saved, if that happened inside a 
+		transaction, to restore it if the transaction is rolled back.
+		"""
+
+		db = connection.connect()
+		depth = db.get_transaction_depth()
+		if not depth:
+			return
+
+		self._saved_in_transaction.setdefault(db, []).append((depth, inf, 
+			created, inf._meta.pop("unsaved-pk", None), 
+			inf.get_changed_columns()))
+
+	def transaction_post_release(self, db, depth):
+		saved = self._saved_in_transaction.get(db)
+		if not saved:
+			return
+
+		if depth == 1:
+			# Committed.
+			del self._saved_in_transaction[db]
+		else:
+			# Saved inside the enclosing transaction now.
+			saved[:] = [(min(e[0], depth - 1),) + e[1:] for e in saved]
+
+	def transaction_post_rollback(self, db, depth):
+		"""Have the instances saved inside the rolled back transaction 
+		count as unsaved again: the created ones get back the primary key
+		they had before, the updated ones their changes.
+		"""
+
+		saved = self._saved_in_transaction.get(db)
+		if not saved:
+			return
+
+		kept = [e for e in saved if e[0] < depth]
+		for d, inf, created, pk, columns in reversed(saved):
+			if d < depth:
+				continue
+
+			model = inf.model_info.model
+			if created:
+				self.uncache(inf)
+				if pk is None:
+					inf._vars.pop(inf.model_info.pkcol, None)
+				else:
+					inf[inf.model_info.pkcol] = pk
+				if inf.get_inst() is not None:
+					self._alive[(model, inf.get_pk_as_key())] = inf
+			else:
+				inf.mark_changed(columns)
+
+			if inf.get_inst() is not None and inf._meta["do-cache"]:
+				self.set_dirty(inf)
+			self.changed(model)
+
+		if kept:
+			saved[:] = kept
+		else:
+			del self._saved_in_transaction[db]
+
+	def model_load_deferred(self, instance):
+		"""Load the deferred columns of *instance* and of the instances
+		loaded along with it, with one query.
+		"""
+
+		inf = get_inst_info(instance)
+		model_info = inf.model_info
+		columns = sorted(inf._deferred)
+
+		infs = dict(inf._deferred_group or {})
+		infs[inf.get_pk_as_key()] = inf
+
+		query = SelectQuery(model_info.model)
+		query._aggregate(map(Select, [model_info.pkcol] + columns), {})
+		query._filter(False, (), {"pk__in": infs.keys()})
+
+		for row in query.execute().fetchall():
+			# Values set since loading are kept.
+			_vars = infs[row[0]]._vars
+			for column, value in itertools.izip(columns, row[1:]):
+				_vars.setdefault(column, value)
+
+		for i in infs.values():
+			if i._deferred_group is not None:
+				i._deferred_group.pop(i.get_pk_as_key(), None)
+			i._deferred = frozenset()
+			i._deferred_group = None
+
 	def model_pre_delete(self, instance):
 		signals.fire("stop-tracking-changes", instance=instance)
 
@@ -213,6 +590,7 @@ class Storage(object):
 			return
 
 		inf = get_inst_info(instance)
+		self.changed(inf.model_info.model)
 
 		self.uncache(inf)
 
@@ -250,64 +628,117 @@ class Storage(object):
 		pass
 	
 	def relation_post_set(self, manager, values, **kwargs):
-		pass
+		self.changed(manager.relation.model, manager.relation.related_model)
 
 	def relation_pre_delete(self, manager, **kwargs):
 		pass
 
 	def relation_post_delete(self, manager, **kwargs):
-		pass
+		self.changed(manager.relation.model, manager.relation.related_model)
 
 	def relation_pre_add(self, manager, values, **kwargs):
 		pass
 
 	def relation_post_add(self, manager, values, **kwargs):
-		pass
+		self.changed(manager.relation.model, manager.relation.related_model)
 
 	def relation_pre_remove(self, manager, values, **kwargs):
 		pass
 
 	def relation_post_remove(self, manager, values, **kwargs):
-		pass
+		self.changed(manager.relation.model, manager.relation.related_model)
 
 storage = Storage()
 
 
 
+# The alias of the column holding the primary key of the instance a 
+# prefetched instance is related to.
+PREFETCH_ALIAS = "heinzel_prefetch_pk"
+
+
 class BaseQuerySet(object):
 	def __init__(self, model, store=None, query=None, db=None):
 		self.model = model
 		self.store = store or storage
 		self.query = query or SelectQuery(model, db)
-		self.db = db or connection.connect()
+		self._db = db
+
+		# The identifiers of the relations to prefetch on evaluation.
+		self._prefetch = ()
+
+		# The instances this queryset evaluated to and the generations of
+		# the models it reads at that time, see Storage.get_generations.
+		self._result_cache = None
+		self._result_generations = None
+
+	@property
+	def db(self):
+		"""The database given on instantiation, or else the one of the 
+		calling thread.
+		"""
+
+		return self._db or connection.connect()
 
 	def __str__(self):
 		return unicode(self).encode(settings.DEFAULT_ENCODING)
 	
 	def __unicode__(self):
-		return unicode(map(str, self.eval()))
+		return unicode(map(str, self._fetch_all()))
 
 	def __repr__(self):
-		return str(map(str, self.eval()))
+		return str(map(str, self._fetch_all()))
 
 	def __eq__(self, other):
 		return type(self) == type(other)\
-			and list(self.eval()) == list(other.eval())
+			and self._fetch_all() == other._fetch_all()
 
 	def __ne__(self, other):
 		return not self.__eq__(other)
 
 	def __iter__(self):
-		return (inst for inst in self.eval())
+		return iter(self._fetch_all())
 
 	def __getitem__(self, item):
-		return self.eval()[item]
+		results = self._get_result_cache()
+		if results is not None:
+			return results[item]
+
+		results = self.eval()[item]
+		if self._prefetch:
+			if isinstance(item, slice):
+				self._prefetch_related(results)
+			else:
+				self._prefetch_related([results])
+		return results
 
 	def __contains__(self, item):
-		return item in self.eval()
+		if not isinstance(item, self.model):
+			return False
+
+		results = self._get_result_cache()
+		if results is not None:
+			return item in results
+		if self.query.limit_node:
+			# Filtering for *item* would happen before the limit.
+			return item in self.eval()
+
+		self._flush()
+		if item.pk is None:
+			return False
+		return self.filter(pk=item.pk).exists()
 
 	def __len__(self):
-		return len(list(self.eval()))
+		results = self._get_result_cache()
+		if results is not None:
+			return len(results)
+		return self.count()
+
+	def __nonzero__(self):
+		results = self._get_result_cache()
+		if results is not None:
+			return bool(results)
+		return self.exists()
 
 	def filter(self, *qobjs, **filters):
 		clone = self._clone()
@@ -329,14 +760,134 @@ class BaseQuerySet(object):
 		clone.query.limit(by, offset)
 		return clone
 
-	def count(self, db_column):
+	def update(self, **values):
+		"""Set the fields in *values* to their values for all rows of this 
+		queryset with one UPDATE statement, and on their instances in 
+		memory. ‘‘Model.save‘‘ is not called and no signals are fired. 
+		Returns the number of rows updated.
+		"""
+
+		columns = {}
+		for name, value in values.items():
+			field = self.model.fields().get(name)
+			if field is None or not field.column_name or field.primary_key:
+				raise ValueError("%s has no column for '%s' to update." 
+														% (self.model, name))
+			if name in self.model.foreignkeys():
+				value = getattr(value, "pk", value)
+			else:
+				value = field.to_python(value)
+			columns[field.column_name] = value
+
+		self._flush()
+		with self.db.transaction():
+			infs = self._get_alive_infs()
+			cursor = SelectionUpdateQuery(self.query, columns, 
+															self._db).execute()
+
+		for inf in infs:
+			inf._vars.update(columns)
+		self.store.changed(self.model)
+
+		return cursor.rowcount
+
+	def delete(self):
+		"""Delete all rows of this queryset with one DELETE statement, and 
+		drop their instances in memory from the store. ‘‘Model.delete‘‘ is
+		not called, the ‘‘model-pre-delete‘‘ and ‘‘model-post-delete‘‘ 
+		signals are fired for the instances in memory only. Returns the 
+		number of rows deleted.
+		"""
+
+		self._flush()
+		with self.db.transaction():
+			infs = self._get_alive_infs()
+			cursor = SelectionDeleteQuery(self.query, self._db).execute()
+
+		for inf in infs:
+			inst = inf.get_inst()
+			if inst is not None:
+				signals.fire("model-pre-delete", instance=inst)
+				signals.fire("model-post-delete", instance=inst, deleted=True)
+		self.store.changed(self.model)
+
+		return cursor.rowcount
+
+	def _get_alive_infs(self):
+		"""Return the InstanceInfo's of the instances in memory whose rows
+		are selected by this queryset. Only their primary keys are queried
+		for, so the cost depends on the number of instances in memory, not
+		on the number of rows.
+		"""
+
+		alive = dict((inf.get("pk"), inf) 
+						for (model, pk), inf in self.store._alive.items()
+						if model is self.model and inf.get("pk") is not None)
+		if not alive:
+			return []
+
+		qs = self
+		if not self.query.limit_node:
+			# Filtering after a limit would select other rows.
+			qs = self.filter(pk__in=alive.keys())
+		return [alive[pk] for pk in qs.values_list("pk", flat=True) 
+															if pk in alive]
+
+	def seek(self, **boundary):
+		"""Return the instances following the one with the values in 
+		*boundary* of the fields ordered by, the primary key being added to
+		the ordering, see SelectQuery.seek.
+		"""
+
+		clone = self._clone()
+		clone.query.make_ordering_total()
+		clone.query.seek(boundary)
+		return clone
+
+	def page_after(self, last_instance=None, size=None):
+		"""Return the *size* instances following *last_instance* in the 
+		ordering of this queryset, or the first *size* instances if 
+		*last_instance* is None. Deep pages cost as much as the first one, 
+		unlike with an offset.
+		"""
+
+		clone = self._clone()
+		fields = clone.query.get_ordering_fields()
+		if last_instance is not None:
+			clone.query.seek(dict((name, getattr(last_instance, name)) 
+														for name in fields))
+		clone.query.limit(size)
+		return clone
+
+	def count(self, db_column=None):
+		"""Return the number of rows selected by this queryset, or, if 
+		*db_column* is given, the number of their non-null values of 
+		*db_column*, as counted by the database.
+		"""
+
+		clone = self._clone()
+		if db_column is None:
+			clone.query._count = True
+		else:
+			clone.query.selection_node.clear()
+			clone.query.annotation_node.clear()
+			clone.query.orderby_node.clear()
+			clone.query.limit_node.clear()
+			clone.query._aggregate((Count(db_column),), {})
+
+		self._flush()
+		return clone.query.execute().fetchone()[0]
+
+	def exists(self):
+		"""Return True if this queryset selects any rows, without reading
+		them.
+		"""
+
 		clone = self._clone()
-		clone.query.selection_node.clear()
-		clone.query.annotation_node.clear()
-		clone.query.orderby_node.clear()
-		clone.query.limit_node.clear()
-		clone.query._aggregate((Count(db_column),), {})
-		return clone.query.execute().fetchall()[0][0]
+		clone.query._exists = True
+
+		self._flush()
+		return clone.query.execute().fetchone() is not None
 		
 	#? implement: is there a valid use case for a reset method?
 	def reset(self):
@@ -362,6 +913,95 @@ class BaseQuerySet(object):
 		)
 		return clone.as_dict()
 
+	def select_related(self, *fields):
+		"""Select the instances the foreign keys named by *fields* point to,
+		e.g. 'brand' or 'brand__manufacturer', in the same query, so that 
+		accessing them needs no further queries.
+		"""
+
+		clone = self._clone()
+		clone.query.select_related(fields)
+		return clone
+
+	def prefetch_related(self, *identifiers):
+		"""Fetch the instances related through the reverse foreign keys or 
+		many-to-many relations named by *identifiers*, e.g. 'car_set', for
+		all instances of this queryset at once when it is evaluated, with 
+		one query per relation. The relation managers of the instances then
+		read them from memory.
+		"""
+
+		for ident in identifiers:
+			relation = self.model._relations.get_relation_by_identity(
+														self.model, ident)
+			if (relation is None or (relation.mode == FK 
+					and not relation.is_reverse_by_model(self.model))):
+				raise ValueError(
+					"'%s' is not a reverse foreign key or many-to-many "
+					"relation of %s." % (ident, self.model)
+				)
+
+		clone = self._clone()
+		clone._prefetch = self._prefetch + identifiers
+		return clone
+
+	def values_list(self, *fields, **kwargs):
+		"""Return an iterable over tuples of the values of *fields*, all 
+		columns of self.model if none are given, e.g. 'name' or 
+		'brand__name'. The keyword *flat* yields the values themselves if
+		only one field is given, *named* yields namedtuples instead. The rows
+		are streamed from the database in chunks, no model instances are 
+		made.
+		"""
+
+		flat = kwargs.pop("flat", False)
+		named = kwargs.pop("named", False)
+		if kwargs:
+			raise TypeError("Unexpected keyword arguments: %s." 
+													% ", ".join(kwargs))
+		if flat and len(fields) != 1:
+			raise TypeError("'flat' needs exactly one field, got %i." 
+															% len(fields))
+		if flat and named:
+			raise TypeError("'flat' and 'named' exclude each other.")
+
+		clone = self._clone()
+		if fields:
+			clone.query.annotation_node.clear()
+			clone.query._aggregate(map(Select, fields), {})
+		else:
+			fields = clone.query.get_selection_aliases()
+		return ValuesListIterator(clone.query, self.store, fields, flat, named)
+
+	def defer(self, *fields):
+		"""Leave the columns of *fields* out of the selection. They are 
+		loaded on first access, for all instances of the queryset missing 
+		them at once.
+		"""
+
+		clone = self._clone()
+		clone.query.defer(self._get_column_names(fields))
+		return clone
+
+	def only(self, *fields):
+		"""Select only the columns of *fields* and of the primary key, see 
+		defer.
+		"""
+
+		clone = self._clone()
+		clone.query.only(self._get_column_names(fields))
+		return clone
+
+	def _get_column_names(self, fields):
+		columns = []
+		for name in fields:
+			field = self.model.fields().get(name)
+			if field is None or not field.column_name:
+				raise ValueError("%s has no column for '%s'." 
+														% (self.model, name))
+			columns.append(field.column_name)
+		return columns
+
 	def distinct(self):
 		clone = self._clone()
 		clone.query._distinct = True
@@ -396,8 +1036,91 @@ class BaseQuerySet(object):
 		return self.store.get(self.query)
 	eval = evaluate
 
+	def iterator(self, chunk_size=None):
+		"""Stream the instances of this queryset from the database, 
+		*chunk_size* rows at a time, without caching them on the queryset.
+		"""
+
+		return iter(self.store.get(self.query, chunk_size))
+
+	def _get_result_cache(self):
+		"""Return the list of instances this queryset evaluated to, or None
+		if it was not evaluated yet or instances of the models it reads 
+		were created, changed or deleted since.
+		"""
+
+		if self._result_cache is None:
+			return None
+		generations = self.store.get_generations(self.query.get_models())
+		if generations != self._result_generations:
+			self._result_cache = self._result_generations = None
+		return self._result_cache
+
+	def _fetch_all(self):
+		"""Evaluate this queryset unless its cached results are valid and
+		return them.
+		"""
+
+		results = self._get_result_cache()
+		if results is None:
+			results = list(self.eval())
+			# Evaluating saves dirty instances, so the generations are
+			# taken afterwards.
+			self._result_generations = self.store.get_generations(
+				self.query.get_models()
+			)
+			self._result_cache = results
+
+			if self._prefetch:
+				self._prefetch_related(results)
+		return results
+
+	def _prefetch_related(self, instances):
+		"""Select the instances related to *instances* through each of the
+		relations in *self._prefetch* and hand them to the InstanceInfo's
+		of *instances*, see BaseRelationManager.get_query_set.
+		"""
+
+		owners = dict((inst.pk, inst) for inst in instances 
+											if inst.pk is not None)
+		if not owners:
+			return
+
+		for ident in self._prefetch:
+			relation = self.model._relations.get_relation_by_identity(
+														self.model, ident)
+			reverse_ident = relation._get_other_identifier(ident)
+
+			## Select the related instances along with the primary key of
+			## the instance they are related to. Many-to-many relations are
+			## joined through their linker table.
+			query = SelectQuery(relation._get_other_model(self.model), 
+																self._db)
+			query._filter(False, (), {reverse_ident + "__in": owners.keys()})
+			query.set_default_selectors()
+			query._annotate((), {PREFETCH_ALIAS: Select(reverse_ident)})
+			index = query.get_selection_aliases().index(PREFETCH_ALIAS)
+
+			groups = dict((pk, []) for pk in owners)
+			for inst, row in self.store.get(query).with_rows():
+				groups[row[index]].append(inst)
+
+			generations = self.store.get_generations(query.get_models())
+			for pk, related in groups.iteritems():
+				get_inst_info(owners[pk])._prefetched[ident] = (related, 
+																generations)
+
+	def _flush(self):
+		"""Save the dirty instances this queryset reads, so the database 
+		knows about them.
+		"""
+
+		self.store.flush(self.query.get_models(), self.query.db)
+
 	def _clone(self):
-		query = deepcopy(self.query, {})
-		return type(self)(query.model, self.store, query, self.db)
+		query = self.query.clone()
+		clone = type(self)(query.model, self.store, query, self._db)
+		clone._prefetch = self._prefetch
+		return clone
 
 QuerySet = BaseQuerySet
@@ -15,6 +15,7 @@ from heinzel.core.sql.dml import (DeleteQuery, UpdateQuery,
 	LinkerTableInsertQuery, LinkerTableDeleteQuery, LinkerTableDeleteAllQuery,
 	ForeignKeyUpdateQuery)
 from heinzel.core.descriptors import (RelationDescriptor, DeferredLoading)
+from heinzel.core.info import get_inst_info
 from heinzel.core.queries import QuerySet
 
 from heinzel.core.constants import FK, M2M, O2O, MODES
@@ -223,7 +224,15 @@ class BaseRelationManager(object):
 
 	def __init__(self, relation, db=None):
 		self.relation = relation
-		self.db = db or connection.connect()
+		self._db = db
+
+	@property
+	def db(self):
+		"""The database given on instantiation, or else the one of the 
+		calling thread.
+		"""
+
+		return self._db or connection.connect()
 
 	def __str__(self):
 		return str(list(self.all()))
@@ -296,9 +305,17 @@ class BaseRelationManager(object):
 		return self.relation._get_other_model(self.model)
 
 	def get_query_set(self):
-		return self.points_to.objects.filter(
+		qs = self.points_to.objects.filter(
 			**{self.reverse_identifier: self.owner.pk}
 		)
+
+		# Instances selected by QuerySet.prefetch_related are the results of
+		# the queryset, until instances of its models change.
+		prefetched = get_inst_info(self.owner)._prefetched.get(
+														self.identifier)
+		if prefetched is not None:
+			qs._result_cache, qs._result_generations = prefetched
+		return qs
 	get = all = get_query_set
 
 	def setup(self, inst, identifier):
@@ -478,6 +495,7 @@ class ForeignKeyManager(BaseRelationManager):
 		q = ForeignKeyUpdateQuery(self.owner, self.identifier, inst.pk, self.db)
 		q.execute()
 		q.commit()
+		get_inst_info(self.owner)._related.pop(self.identifier, None)
 
 	_add = _set
 
@@ -485,6 +503,7 @@ class ForeignKeyManager(BaseRelationManager):
 		q = ForeignKeyUpdateQuery(self.owner, self.identifier, None, self.db)
 		q.execute()
 		q.commit()
+		get_inst_info(self.owner)._related.pop(self.identifier, None)
 
 	def _remove(self):
 		raise NotImplemented
@@ -8,6 +8,8 @@ SIGNALS = {
 	# is fired.
 
 	"cache-rollback": (),
+	"transaction-post-release": ("db", "depth"),
+	"transaction-post-rollback": ("db", "depth"),
 	"start-tracking-changes": ("instance",),
 	"stop-tracking-changes": ("instance",),
 	"instance-deleted": ("inst_info",),
@@ -15,10 +17,13 @@ SIGNALS = {
 	"model-post-init": ("instance", "kwargs"),
 	"model-pre-save": ("instance",),
 	"model-post-save": ("instance", "created"),
+	"model-pre-bulk-save": ("model", "instances"),
+	"model-post-bulk-save": ("model", "instances"),
 	"model-pre-delete": ("instance",),
 	"model-post-delete": ("instance", "deleted"),
 	"model-pre-update": ("instance", "value", "fieldname"),
 	"model-post-update": ("instance", "value", "fieldname"),
+	"model-load-deferred": ("instance",),
 	
 	# not implemented, because, what instance, should be cached, if there
 	# is more than one with the same model type and primary key?
@@ -117,7 +122,7 @@ def get_signals_for_object(obj):
 def object_is_registered_with_signal(obj, signal):
 	if not signal in registry:
 		return False
-	return any(lambda wref, cb_name: wref() is obj, registry[signal])
+	return any(wref() is obj for wref, cb_name in registry[signal])
 
 
 def delete_signal(signal):
@@ -2,6 +2,7 @@
 
 from heinzel.core import connection
 from heinzel.core import constants
+from heinzel.core.exceptions import ValidationError
 
 
 type_map = {	None:		"null",
@@ -15,10 +16,29 @@ type_map = {	None:		"null",
 				datetime:	"DATETIME"	}
 
 
+# SQL actions for the on_delete values of RelationFields. Other values 
+# allow deletes by setting the referencing columns to null.
+on_delete_map = {	"cascade":	"CASCADE",
+					"restrict":	"RESTRICT"	}
+
+
 def link_table_name(mode, ptable, keycol, rtable):
 	return "%s__%s__%s__%s" %(mode, ptable, keycol, rtable)
 
 
+def index_name(table, columns):
+	return "%s__%s__idx" % (table, "__".join(columns))
+
+
+def references(table, on_delete="cascade"):
+	"""Returns the clause declaring a column to be a foreign key for 
+	*table*.
+	"""
+
+	return " REFERENCES %s(id) ON DELETE %s" % (table, 
+								on_delete_map.get(on_delete, "SET NULL"))
+
+
 class TableCreation(object):
 	def __init__(self, model):
 		self.model = model
@@ -54,33 +74,123 @@ class TableCreation(object):
 		return "CREATE TABLE %s (%s);" %(self.model.tablename(), ", ".join(sql)), ()
 
 
-def create_or_alter_relation_table(relation):
+def create_index(table, columns, name="", unique=False, where=None):
+	"""Returns the sql for an index on *columns* of *table*, see 
+	`heinzel.core.fields.Index`."""
+
+	return "CREATE %sINDEX IF NOT EXISTS %s ON %s (%s)%s" % (
+		"UNIQUE " if unique else "",
+		name or index_name(table, columns),
+		table,
+		", ".join(columns),
+		" WHERE %s" % where if where else ""
+	)
+
+
+def create_indexes(model):
+	"""Returns the sql for the indexes on the table of *model*: one for each
+	Field with index=True, and those in the `indexes` of its Meta class."""
+
+	table = model.tablename()
+	sql = []
+
+	for name, field in sorted(model.non_related().items()):
+		# SQLite indexes primary keys and unique columns on its own.
+		if (name == "pk" or not field.index or field.primary_key 
+				or field.unique):
+			continue
+		sql.append(create_index(table, [field.column_name]))
+
+	for index in model._indexes:
+		columns = []
+		for name in index.fields:
+			field = model.fields().get(name)
+			if field is None or not field.column_name:
+				raise ValidationError("Model %s has no column for '%s' in %s." 
+														% (model, name, index))
+			columns.append(field.column_name)
+		sql.append(create_index(table, columns, index.name, index.unique, 
+																index.where))
+
+	return sql
+
+
+def create_relation_indexes(relation, foreign_keys=False):
+	"""Returns the sql for the indexes to look up the related rows of 
+	*relation* by, from either side. See `_sql_stmt__create_link_table` 
+	for the meaning of *foreign_keys*."""
+
+	if relation.mode == constants.FK:
+		return [create_index(relation.model.tablename(), 
+										[relation.identifier + "_id"])]
+
+	if relation.mode == constants.M2M:
+		table = link_table_name(
+			constants.MODES[relation.mode],
+			relation.model.tablename(), 
+			relation.identifier,
+			relation.related_model.tablename()
+		)
+		ident = relation.identifier + "_id"
+		rev_ident = relation.reverse_identifier + "_id"
+
+		sql = [create_index(table, [ident, rev_ident])]
+		# Otherwise the UNIQUE constraint indexes these columns already.
+		if not foreign_keys:
+			sql.append(create_index(table, [rev_ident, ident]))
+		return sql
+
+	# The columns of one-to-one link tables are UNIQUE, so indexed already.
+	return []
+
+
+def create_or_alter_relation_table(relation, foreign_keys=False):
 	"""Here we create the sql for any linker tables or table columns to relate 
-		the models."""
+		the models. If *foreign_keys* is True, the columns are declared as
+		foreign keys, see `heinzel.core.sql.triggers` for the alternative."""
 
 	if relation.mode == constants.FK:		
 		# id fields are always of type int
 		return (
-			"ALTER TABLE %(table)s ADD %(name)s_id %(type)s" 
+			"ALTER TABLE %(table)s ADD %(name)s_id %(type)s%(references)s" 
 				% {"table": relation.model.tablename(),
 					"name": relation.identifier,
-					"type": type_map[int]}
+					"type": type_map[int],
+					"references": references(
+						relation.related_model.tablename(),
+						relation.model.fields()[relation.identifier].on_delete
+					) if foreign_keys else ""}
 		)
 
 	else:
 		# if rel.mode in (constants.M2M, constants.O2O)
-		return _sql_stmt__create_link_table(relation)
+		return _sql_stmt__create_link_table(relation, foreign_keys)
 
-def _sql_stmt__create_link_table(relation):
+def _sql_stmt__create_link_table(relation, foreign_keys=False):
 	'''Returns the sql for a linker table for many-to-many or one-to-one
-	relationships between 2 models.
+	relationships between 2 models. With *foreign_keys*, a link is deleted
+	along with either of the rows it links, and many-to-many links must be
+	unique.
 	'''
 
+	unique = " UNIQUE" if relation.mode == constants.O2O else ""
+	ident_constraints = rev_ident_constraints = unique
+	table_constraints = ""
+
+	if foreign_keys:
+		ident_constraints += " NOT NULL" + references(
+										relation.related_model.tablename())
+		rev_ident_constraints += " NOT NULL" + references(
+												relation.model.tablename())
+		if relation.mode == constants.M2M:
+			table_constraints = ",\n\tUNIQUE(%s_id, %s_id)" % (
+						relation.reverse_identifier, relation.identifier)
+
 	return """
 CREATE TABLE %s (
 	id INTEGER PRIMARY KEY NOT NULL,
 	%s_id INTEGER%s,
-	%s_id INTEGER%s
+	%s_id INTEGER%s%s
 )""" % (link_table_name(
 			constants.MODES[relation.mode],
 			relation.model.tablename(), 
@@ -88,7 +198,8 @@ CREATE TABLE %s (
 			relation.related_model.tablename()
 			),
 			relation.identifier,
-			" UNIQUE" if relation.mode == constants.O2O else "",
+			ident_constraints,
 			relation.reverse_identifier,
-			" UNIQUE" if relation.mode == constants.O2O else ""	
+			rev_ident_constraints,
+			table_constraints
 		)
@@ -1,9 +1,14 @@
 # -*- coding: utf-8 -*-
 
+import re
 import sys
+import json
+import sqlite3
+from datetime import date, datetime
 from copy import deepcopy
 from hashlib import md5
 
+from heinzel import settings
 from heinzel.core import fields
 from heinzel.core import connection
 from heinzel.core import exceptions
@@ -112,7 +117,57 @@ def filter_factory(filtername):
 	return Filter(filtername, *FILTERS[filtername])
 
 
+def _has_json_each():
+	"""Return True if SQLite was built with the JSON1 functions."""
+
+	try:
+		sqlite3.connect(":memory:").execute("SELECT * FROM json_each('[]')")
+	except sqlite3.OperationalError:
+		return False
+	return True
+
+HAS_JSON_EACH = _has_json_each()
+
+# UPDATE ... RETURNING needs SQLite 3.35.
+HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+
+def _dump_json_array(values):
+	"""Return *values* as a JSON array, each converted the way sqlite3 
+	binds it as a parameter, or None if one of them can't be converted.
+	"""
+
+	converted = []
+	for value in values:
+		if isinstance(value, datetime):
+			value = utils.adapt_datetime_to_string(value)
+		elif isinstance(value, date):
+			value = value.isoformat()
+		elif isinstance(value, str):
+			try:
+				value = value.decode("utf-8")
+			except UnicodeDecodeError:
+				return None
+		elif isinstance(value, bool):
+			value = int(value)
+		elif isinstance(value, (int, long)):
+			if not -2**63 <= value < 2**63:
+				return None
+		elif isinstance(value, float):
+			# JSON has no NaN and Infinity.
+			if value != value or abs(value) == float("inf"):
+				return None
+		elif not (value is None or isinstance(value, unicode)):
+			# E.g. buffers, which are bound as BLOBs.
+			return None
+		converted.append(value)
+	return json.dumps(converted)
+
+
 class Filter(object):
+	# The values as a JSON array if they are passed as one, see is_packed.
+	_json = None
+
 	def __init__(self, name, opstr, placeholder_fn, unpack_fn, to_sql_fn):
 		self.name = name
 		self._opstr = opstr
@@ -135,19 +190,50 @@ class Filter(object):
 	def __ne__(self, other):
 		return not self.__eq__(other)
 
-	def render(self, table, column):
-		return self._opstr \
-				% self._placeholder_fn(self.get_values(table, column))
+	def render(self, prefix):
+		if self.is_packed():
+			return u"IN (SELECT value FROM json_each(:%s))" \
+												% self.escape_token(prefix, 0)
+		return self._opstr % self._placeholder_fn(self.get_values(prefix))
+
+	def get_values(self, prefix):
+		if self.is_packed():
+			return [(self.escape_token(prefix, 0), self.get_value(0))]
+		return [(self.escape_token(prefix, i), v) for i, v \
+													in enumerate(self._values)]
+
+	def get_value(self, index):
+		"""Return the value of the parameter at *index*."""
+
+		if self.is_packed():
+			return self._json
+		return self._values[index]
+
+	def get_arity(self):
+		"""Return the number of values, or None if they are packed."""
+
+		if self.is_packed():
+			return None
+		return len(self._values)
 
-	def get_values(self, table, column):
-		return [(self.escape_token(table, column, v), v) for v \
-													in self._values]
+	def is_packed(self):
+		"""An IN filter with more than settings.MAX_IN_PARAMETERS values 
+		passes them as one JSON array, selected from by json_each, if SQLite
+		supports it and all values can be converted to JSON.
+		"""
+
+		return self._json is not None
 
 	def set_values(self, values):
 		self._values = []
 		for v in self._unpack_fn(values):
 			self._values.append(self.to_sql(v))
 
+		self._json = None
+		if (self.name == "in" and HAS_JSON_EACH
+				and len(self._values) > settings.MAX_IN_PARAMETERS):
+			self._json = _dump_json_array(self._values)
+
 	def to_sql(self, value):
 		"""
 		Return a value for the dictionary, that is going to be passed to the
@@ -160,8 +246,8 @@ class Filter(object):
 			return value
 		return self._to_sql_fn(value)
 
-	def escape_token(self, table, column, value):
-		return "%s__%s__%s__%i" % (table, column, self.name, id(value))
+	def escape_token(self, prefix, index):
+		return "%s_%i" % (prefix, index)
 
 
 class BaseSelector(object):
@@ -264,40 +350,15 @@ class Parser(object):
 		for selobj in self._combine_selectors(args, kwargs):			
 			fields = self.tokenize(selobj.field)
 
-			joins, (db_table, db_column) = self._traverse(fields)
+			joins, (db_table, db_column), table_alias = self._traverse(fields)
 
 			if db_table is db_column is None:
 				raise Exception(
 					"Error parsing fields '%s' on %s." % (fields, self.model)
 				)
 
-			for join in joins:
-				if not join in self.query.joins_order:
-					self.query.joins_order.append(join)
-
-			if joins:
-				# the crucial last join of joins might have been added
-				# before this iteration of _parse_q and might already have
-				# got a 'right_side_alias' different from this iteration's
-				# joins' last join: Get the right join and take it's 
-				# get_right_side_alias() as db_table.
-				join = self.query.joins_order[
-					self.query.joins_order.index(joins[-1])
-				]
-
-			elif self.query.joins_order:
-				# no joins were encountered, but there might be previously
-				# encountered ones.				
-				join = self.query.joins_order[0]
-
-			else:
-				# there are no joins whatsoever, the value returned from 
-				# :meth:‘Parser._traverse‘, *db_table*, is correct.
-				join = None
-
-			sel_leaves.append(
-				SelectionLeaf(join, db_table, db_column, selobj.alias, selobj.fn)
-			)
+			sel_leaves.append(SelectionLeaf(table_alias, db_table, db_column,
+												selobj.alias, selobj.fn))
 
 		return sel_leaves
 
@@ -315,35 +376,16 @@ class Parser(object):
 
 			fields, filter = self.lex(k)
 
-			joins, (db_table, db_column) = self._traverse(fields)
+			joins, (db_table, db_column), table_alias = self._traverse(fields)
 
 			if db_table is db_column is None:
 				# this might set 'db_table' to the empty string
 				(db_table, db_column) = self._filter_annotations(fields)
+				table_alias = db_table
 
-			for join in joins:
-				if not join in self.query.joins_order:
-					self.query.joins_order.append(join)
-
-			if not db_table == "":
-				# this is not an annotation
-				if joins:
-					# the crucial last join of joins might have been added
-					# before this iteration of _parse_q and might already have
-					# got a 'right_side_alias' different from this iteration's
-					# joins' last join: Get the correct join to put it into
-					# the WhereLeaf.
-					join = self.query.joins_order[
-						self.query.joins_order.index(joins[-1])
-					]
-				elif self.query.joins_order:
-					join = self.query.joins_order[0]
-				else:
-					join = None
-			else:
-				join = None
-
-			node.children.append(WhereLeaf(join, db_table, db_column, filter, v))
+			node.children.append(
+				WhereLeaf(table_alias, db_table, db_column, filter, v)
+			)
 
 		for branch in qobject.get_branches():
 			node.children.append(self._parse_q(branch))
@@ -351,13 +393,22 @@ class Parser(object):
 		return node
 
 	def _traverse(self, tokens):
+		"""Follow the relations named by *tokens* to the field named by the
+		last token. Return a tuple of the joins needed, which are added to
+		the query's joins, a tuple of (table, column) of the field, and the
+		alias of the field's table in the query.
+		"""
+
 		joins = []
+		table_alias = BASE_ALIAS
 
 		model = self.model
 		for t in tokens:
 			relation = model._relations.get_relation_by_identity(model, t)
 			if relation:
-				joins.append(Join(relation, t))
+				join = self.query.get_join(relation, t, table_alias)
+				joins.append(join)
+				table_alias = join.get_right_side_alias()
 
 				if relation.is_reverse_by_model(model):
 					model = relation.model
@@ -385,7 +436,7 @@ class Parser(object):
 			db_table = model.tablename()
 			db_column = model.pk.column_name
 
-		return tuple(joins), (db_table, db_column)
+		return tuple(joins), (db_table, db_column), table_alias
 
 	def _combine_selectors(self, args, kwargs):
 		queue = []
@@ -417,15 +468,35 @@ class Parser(object):
 		)
 
 
+# The alias of the table of the model a SelectQuery selects from. Joined
+# tables are aliased t1, t2, ... in the order they are joined.
+BASE_ALIAS = "t0"
+
+# {SelectQuery shape: (sql, bind function), ...}
+compiled_queries = {}
+
+# Matches the named parameters of rendered SQL.
+_param_re = re.compile(r":(\w+)")
+
+
 class BaseQuery(object):
 	def __init__(self, model, db=None):
 		self.model = model
 		self.db_table = model.tablename()
-		self.db = db or connection.connect()
+		self._db = db
 		self.db_columns = self.db.table_registry[self.db_table].columns
 
-	def execute(self):
-		return self.db.execute(*self.as_sql())
+	@property
+	def db(self):
+		"""The database given on instantiation, or else the one of the 
+		calling thread.
+		"""
+
+		return self._db or connection.connect()
+
+	def execute(self, cursor=None):
+		stmt, values = self.as_sql()
+		return self.db.execute(stmt, values, cursor)
 
 	def commit(self):
 		return self.db.commit()
@@ -448,17 +519,58 @@ class SelectQuery(BaseQuery):
 		self.where_node = utils.Node()
 		self.orderby_node = utils.Node()
 		self.limit_node = utils.Node()
+		self.seek_node = utils.Node()
 		
 		self._distinct = False
 
+		# If True, the query renders to a count of the rows it selects, or
+		# to a single row if it selects any rows at all.
+		self._count = False
+		self._exists = False
+
+		# [(path of identifiers, model, [column, ...]), ...] of the foreign
+		# keys followed by select_related, parents before their children.
+		# The columns of their tables are selected by *self.related_node*
+		# in the same order.
+		self.related = []
+		self.related_node = utils.Node()
+
+		# The columns of self.model not selected by default, see defer.
+		self.deferred = frozenset()
+
 	def __str__(self):
 		return (
 			"<SelectQuery instance at %i: query='%s', values=%r>"
 			% (id(self), self.render(), self.get_values())
 		)
 
+	def clone(self):
+		"""Return a copy of this query, that shares its joins and leaves 
+		with this query. Only the lists holding them are copied: joins and
+		leaves are never altered once they belong to a query, so the 
+		copy and this query may be changed independently. A shared leaf may
+		have another position in the copy, which is why the names of its 
+		parameters are given to it on rendering, see get_param_prefixes.
+		"""
+
+		clone = object.__new__(type(self))
+		clone.__dict__.update(self.__dict__)
+
+		clone.joins_order = list(self.joins_order)
+		clone.related = list(self.related)
+		clone.parser = self.parser_class(clone)
+
+		for name in ("selection_node", "annotation_node", "where_node",
+						"orderby_node", "limit_node", "related_node",
+						"seek_node"):
+			node = getattr(self, name)
+			setattr(clone, name, 
+				utils.Node(node.children, node.connector, node.negate))
+
+		return clone
+
 	def __deepcopy__(self, memo):
-		clone = SelectQuery(self.model, self.db, self.parser_class)
+		clone = SelectQuery(self.model, self._db, self.parser_class)
 	
 		clone.joins_order = deepcopy(self.joins_order)
 
@@ -467,7 +579,13 @@ class SelectQuery(BaseQuery):
 		clone.where_node = deepcopy(self.where_node, memo)
 		clone.orderby_node = deepcopy(self.orderby_node, memo)
 		clone.limit_node = deepcopy(self.limit_node, memo)
+		clone.seek_node = deepcopy(self.seek_node, memo)
+		clone.related = list(self.related)
+		clone.related_node = deepcopy(self.related_node, memo)
+		clone.deferred = self.deferred
 		clone._distinct = deepcopy(self._distinct, memo)
+		clone._count = self._count
+		clone._exists = self._exists
 
 		return clone
 
@@ -483,15 +601,188 @@ class SelectQuery(BaseQuery):
 	def __ne__(self, other):
 		return not self.__eq__(other)
 
+	def get_shape(self):
+		"""Return a hashable description of the structure of this query. 
+		Queries of the same shape render the same SQL, except for the
+		values of their parameters.
+		"""
+
+		def selection_shape(node):
+			return tuple((l.table_alias, l.db_table, l.db_column, l.alias,
+						l.function) for l in node)
+
+		def where_shape(node):
+			shape = []
+			for ch in node:
+				if isinstance(ch, utils.Node):
+					shape.append(where_shape(ch))
+				else:
+					shape.append((ch.table_alias, ch.db_table, ch.db_column,
+									ch.filter.name, ch.filter.get_arity()))
+			return (node.connector, node.negate, tuple(shape))
+
+		return (
+			self.model,
+			self._distinct,
+			self._count,
+			self._exists,
+			self.deferred,
+			tuple((j.rel, j.ident, j.left_alias) for j in self.joins_order),
+			selection_shape(self.selection_node),
+			selection_shape(self.annotation_node),
+			selection_shape(self.related_node),
+			where_shape(self.where_node),
+			tuple((l.db_table, l.db_column, l.desc) for l in self.orderby_node),
+			bool(self.limit_node),
+			tuple((tuple(l.db_columns), tuple(l.descs)) 
+											for l in self.seek_node),
+		)
+
+	def compile(self):
+		"""Render this query, and return a tuple of the SQL with positional
+		parameters and a function, that returns the parameters of any
+		query of the same shape for that SQL.
+		"""
+
+		# The SQL and the positions of its parameters are taken from the
+		# same numbering of the leaves.
+		leaves = self.get_where_leaves()
+		prefixes = self.get_param_prefixes(leaves)
+		sql = self.render(prefixes)
+
+		# {parameter name: (index of the WhereLeaf, index of its value)}
+		positions = {}
+		for i, leaf in enumerate(leaves):
+			for j, (name, value) in enumerate(
+										leaf.get_values(prefixes[id(leaf)])):
+				positions.setdefault(name, (i, j))
+		for leaf in self.limit_node.children + self.seek_node.children:
+			for name in leaf.get_values():
+				positions[name] = name
+
+		order = []
+		def positional(match):
+			order.append(positions[match.group(1)])
+			return "?"
+		sql = _param_re.sub(positional, sql)
+
+		def bind(query):
+			leaves = query.get_where_leaves()
+			named = {}
+			for leaf in query.limit_node.children + query.seek_node.children:
+				named.update(leaf.get_values())
+			params = []
+			for pos in order:
+				if isinstance(pos, basestring):
+					params.append(named[pos])
+				else:
+					params.append(leaves[pos[0]].filter.get_value(pos[1]))
+			return params
+
+		return sql, bind
+
+	def as_sql(self):
+		"""The SQL is rendered only for the first query of a shape, later
+		queries of that shape reuse it.
+		"""
+
+		shape = self.get_shape()
+		try:
+			sql, bind = compiled_queries[shape]
+		except KeyError:
+			if len(compiled_queries) >= settings.COMPILED_QUERY_CACHE_SIZE:
+				compiled_queries.clear()
+			sql, bind = compiled_queries[shape] = self.compile()
+		return sql, bind(self)
+
+	def get_join(self, relation, identifier, left_alias):
+		"""Return the join of the table aliased *left_alias* to the other 
+		side of *relation*, adding it to *self.joins_order* if it has not 
+		been joined yet.
+		"""
+
+		join = Join(relation, identifier, left_alias)
+		try:
+			return self.joins_order[self.joins_order.index(join)]
+		except ValueError:
+			join.right_alias = "t%i" % (len(self.joins_order) + 1)
+			self.joins_order.append(join)
+			return join
+
+	def select_related(self, tokens):
+		"""Join the tables of the models the foreign keys named by *tokens*
+		point to, e.g. "brand" or "brand__manufacturer", and select their 
+		columns along with those of *self.model*.
+		"""
+
+		for token in tokens:
+			fields = self.parser.tokenize(token)
+			model = self.model
+			table_alias = BASE_ALIAS
+
+			for i, t in enumerate(fields):
+				relation = model._relations.get_relation_by_identity(model, t)
+				if (relation is None or relation.mode != FK
+						or relation.is_reverse_by_model(model)):
+					raise ValueError(
+						"'%s' is not a foreign key of %s." % (t, model)
+					)
+
+				join = self.get_join(relation, t, table_alias)
+				table_alias = join.get_right_side_alias()
+				model = relation.related_model
+
+				path = tuple(fields[:i+1])
+				if path in [p for p, m, c in self.related]:
+					continue
+
+				columns = sorted(self.db.table_registry[model.tablename()]
+																.columns)
+				self.related.append((path, model, columns))
+				prefix = "__".join(path) + "__"
+				self.related_node.extend([
+					SelectionLeaf(table_alias, model.tablename(), c, 
+																prefix + c)
+					for c in columns
+				])
+
+	def defer(self, columns):
+		"""Leave *columns* out of the default selection. The primary key is
+		always selected.
+		"""
+
+		self.deferred = self.deferred.union(columns).difference(
+											[self.model.pk.column_name])
+		# The default selection might have been set on rendering already.
+		self.selection_node.clear()
+
+	def only(self, columns):
+		"""Select only *columns* and the primary key by default."""
+
+		self.deferred = frozenset()
+		self.defer([c for c in self.db_columns if c not in columns])
+
+	def get_models(self):
+		"""Return the set of models whose tables this query reads."""
+
+		models = set([self.model])
+		for join in self.joins_order:
+			models.add(join.rel.model)
+			models.add(join.rel.related_model)
+		return models
+
 	def orderby(self, token=None):
 		if token is None:
 			self.orderby_node.clear()
 		else:
 			obl = OrderByLeaf(self.model, token)
 			if obl in self.orderby_node:
-				self.orderby_node.children[
-					self.orderby_node.children.index(obl)
-				].toggle()
+				# The leaf may be shared with clones of this query, so it is
+				# replaced by a toggled copy.
+				i = self.orderby_node.children.index(obl)
+				obl = deepcopy(self.orderby_node.children[i])
+				obl.toggle()
+				self.orderby_node.children[i] = obl
 			else:
 				self.orderby_node.append(obl)
 
@@ -500,8 +791,90 @@ class SelectQuery(BaseQuery):
 		leaf = LimitLeaf(by, offset)
 		self.limit_node.append(leaf)
 
-	def render(self):
-		"""Recursively render the nested *self.where_node* structure."""
+	def make_ordering_total(self):
+		"""Add the primary key to the ordering, unless it is part of it, so
+		that no two rows are equal in it. It follows the direction of the 
+		last field ordered by.
+		"""
+
+		pkcol = self.model.pk.column_name
+		if not self.orderby_node:
+			self.orderby("pk")
+		elif pkcol not in [l.db_column for l in self.orderby_node]:
+			self.orderby("-pk" if self.orderby_node.children[-1].desc 
+																else "pk")
+
+	def get_ordering_fields(self):
+		"""Return the names of the fields ordered by, see 
+		make_ordering_total.
+		"""
+
+		self.make_ordering_total()
+		return [l.token for l in self.orderby_node]
+
+	def seek(self, boundary):
+		"""Narrow the selection to the rows following the row, whose values of
+		the fields ordered by are given by the dict *boundary*, e.g. 
+		{"title": "Alien", "pk": 12}. Unlike an offset, this needs no rows 
+		before the boundary to be read if the fields are indexed. The 
+		fields must not be NULL.
+		"""
+
+		pkcol = self.model.pk.column_name
+		values = []
+		for leaf in self.orderby_node:
+			if leaf.token in boundary:
+				values.append(boundary[leaf.token])
+			elif leaf.db_column == pkcol and "pk" in boundary:
+				values.append(boundary["pk"])
+			else:
+				raise ValueError(
+					"Need a value for '%s' to seek the rows of %s after, "
+					"got %s." % (leaf.token, self.model, boundary.keys())
+				)
+
+		self.seek_node.clear()
+		self.seek_node.append(SeekLeaf(
+			[l.db_column for l in self.orderby_node],
+			[l.desc for l in self.orderby_node],
+			values
+		))
+
+	def slice(self, start=None, stop=None):
+		"""Narrow the rows selected by this query to the python slice bounds
+		*start* and *stop*, relative to any limit set before. Neither bound
+		may be negative.
+		"""
+
+		limit, offset = None, 0
+		if self.limit_node:
+			leaf = self.limit_node.children[0]
+			if leaf.limit != sys.maxint:
+				limit = leaf.limit
+			offset = leaf.offset
+
+		start = start or 0
+		offset += start
+		if limit is not None:
+			limit = max(limit - start, 0)
+		if stop is not None:
+			by = max(stop - start, 0)
+			if limit is None or by < limit:
+				limit = by
+
+		self.limit(limit, offset)
+
+	def render(self, prefixes=None):
+		"""Recursively render the nested *self.where_node* structure. The
+		parameters of the :class:‘WhereLeaf‘'s are named by *prefixes*, see
+		:meth:‘get_param_prefixes‘.
+		"""
+
+		if prefixes is None:
+			prefixes = self.get_param_prefixes(self.get_where_leaves())
+
+		if self._count or self._exists:
+			return self.render_probe(prefixes)
 
 		sql = ["SELECT"]
 
@@ -515,20 +888,10 @@ class SelectQuery(BaseQuery):
 		self.update_nodes()
 
 		sql.append(", ".join([n.render() for n in self.selection_node] +
-								[n.render() for n in self.annotation_node]))
-
-		# from part
-		sql.append("FROM")
-		
-		for j in self.joins_order:
-			sql.append(j.render())
-
-		if not self.joins_order:
-			sql.append(self.model.tablename())
+								[n.render() for n in self.annotation_node] +
+								[n.render() for n in self.related_node]))
 
-		if self.where_node:
-			sql.append("WHERE")
-			sql.append(self.where_node.render())
+		sql.extend(self.render_from(prefixes))
 
 		sql.append("ORDER BY")
 		sql.append(", ".join([n.render() for n in self.orderby_node]))
@@ -543,13 +906,82 @@ class SelectQuery(BaseQuery):
 
 		return u" ".join(sql)
 
+	def render_from(self, prefixes):
+		"""Render the FROM and WHERE parts of the query as a list."""
+
+		# from part
+		sql = ["FROM"]
+		sql.append("%s AS %s" % (self.model.tablename(), BASE_ALIAS))
+		
+		for j in self.joins_order:
+			sql.append(j.render())
+
+		conditions = []
+		if self.where_node:
+			conditions.append(self.render_where(self.where_node, prefixes))
+		if self.seek_node:
+			conditions.append(self.seek_node.render())
+		if conditions:
+			sql.append("WHERE")
+			sql.append(" AND ".join(conditions))
+
+		return sql
+
+	def render_where(self, node, prefixes):
+		"""Render *node* of *self.where_node* like :meth:‘utils.Node.render‘,
+		naming the parameters of its leaves by *prefixes*.
+		"""
+
+		bits = []
+		for ch in node.children:
+			if isinstance(ch, utils.Node):
+				bits.append(self.render_where(ch, prefixes))
+			else:
+				bits.append(ch.render(prefixes[id(ch)]))
+
+		bits = filter(None, bits)
+
+		return "".join((
+			"NOT "*node.negate,
+			"("*((len(bits) > 1) or node.negate),
+			(" %s " % node.connector).join(bits),
+			")"*((len(bits) > 1) or node.negate)
+		))
+
+	def render_probe(self, prefixes):
+		"""Render a SELECT COUNT(*) of the rows this query selects, or, if
+		*self._exists* is set, a SELECT 1 of the first of them.
+		"""
+
+		if self._distinct or self.limit_node:
+			# The rows need to be selected, before they can be counted.
+			inner = self.clone()
+			inner._count = inner._exists = False
+			if self._exists:
+				return u"SELECT 1 FROM (%s) LIMIT 1" % inner.render(prefixes)
+			return u"SELECT COUNT(*) FROM (%s)" % inner.render(prefixes)
+
+		sql = ["SELECT", "1" if self._exists else "COUNT(*)"]
+		sql.extend(self.render_from(prefixes))
+		if self._exists:
+			sql.append("LIMIT 1")
+
+		return u" ".join(sql)
+
 	def get_values(self):
 		"""Returns a dict of all WhereLeaf values to be passed to the database
 		adapter for proper escaping."""
 
+		leaves = self.get_where_leaves()
+		prefixes = self.get_param_prefixes(leaves)
+
 		d = {}
-		for wl in utils.recurse(self.where_node):
-			d.update(wl.get_values())
+		for wl in leaves:
+			d.update(wl.get_values(prefixes[id(wl)]))
+		for ll in self.limit_node:
+			d.update(ll.get_values())
+		for sl in self.seek_node:
+			d.update(sl.get_values())
 		return d
 
 	def set_default_selectors(self):
@@ -562,7 +994,7 @@ class SelectQuery(BaseQuery):
 		"""
 
 		sel_leaves = self.parser.parse_selectors(
-					map(Select, self.db_columns), {})
+			[Select(c) for c in self.db_columns if c not in self.deferred], {})
 
 		self.selection_node.extend(sel_leaves)
 
@@ -577,31 +1009,25 @@ class SelectQuery(BaseQuery):
 
 	def update_nodes(self):
 		"""
-		Update any :class:‘SelectionLeaf‘'s *join* with the first join of
-		*self.joins_order* if it doesn't already have a join.
+		Set the default selectors, if there are no :class:‘SelectionLeaf‘'s.
 		"""
 
 		if not self.selection_node:
 			self.set_default_selectors()
 
-		if not self.joins_order:
-			return
-
-		for leaf in self.selection_node:
-			if not leaf.join:
-				leaf.join = self.joins_order[0]
+	def get_where_leaves(self):
+		"""Return the list of :class:‘WhereLeaf‘'s of *self.where_node*."""
 
-		for leaf in self.annotation_node:
-			if not leaf.join:
-				leaf.join = self.joins_order[0]
+		return utils.recurse(self.where_node)
 
-		for leaf in utils.recurse(self.where_node):
-			if not leaf.join and not leaf.db_table == "":
-				leaf.join = self.joins_order[-1]
+	def get_param_prefixes(self, leaves):
+		"""Return {id(leaf): prefix, ...}, naming the parameters of each of
+		the :class:‘WhereLeaf‘'s *leaves* by its position. The leaves may be
+		shared with clones of this query, where they have other positions,
+		so the prefixes are not stored on them.
+		"""
 
-		orderby_table = self.joins_order[0].get_left_side_alias()
-		for obl in self.orderby_node:
-			obl.db_table = orderby_table
+		return dict((id(leaf), "p%i" % i) for i, leaf in enumerate(leaves))
 
 	def _filter(self, negate, qobjs, filters):
 		self.where_node.append(self.parser.parse_filters(negate, qobjs,
@@ -609,6 +1035,8 @@ class SelectQuery(BaseQuery):
 
 	def _aggregate(self, args, kwargs):
 		self.selection_node.clear()
+		self.related_node.clear()
+		self.related = []
 		sel_node = self.parser.parse_selectors(args, kwargs)
 		self.selection_node.extend(sel_node)
 
@@ -636,6 +1064,206 @@ class InsertQuery(BaseQuery):
 		return self.render(), self.values
 
 
+class BulkInsertQuery(InsertQuery):
+	"""Generates the SQL for persisting many instances of *model* with one
+	executemany per *batch_size* instances, or a single one if *batch_size*
+	is None. Instances without a primary key value get the consecutive 
+	rowids sqlite assigned to their rows.
+	"""
+
+	def __init__(self, model, instances, db=None, batch_size=None):
+		BaseQuery.__init__(self, model, db)
+		self.instances = instances
+		self.batch_size = batch_size
+
+	def execute(self):
+		pkcol = self.model.pk.column_name
+		stmt = self.render()
+
+		explicit = [i for i in self.instances if i.pk is not None]
+		auto = [i for i in self.instances if i.pk is None]
+
+		for batch in self.batches(explicit):
+			self.db.executemany(stmt, self.get_values(batch))
+
+		for batch in self.batches(auto):
+			self.db.executemany(stmt, self.get_values(batch))
+			last = self.db.execute("SELECT last_insert_rowid()").fetchone()[0]
+			for id, inst in enumerate(batch, last - len(batch) + 1):
+				inst._inst_info[pkcol] = id
+
+	def batches(self, instances):
+		size = self.batch_size or len(instances) or 1
+		for i in xrange(0, len(instances), size):
+			yield instances[i:i + size]
+
+	def as_sql(self):
+		return self.render(), self.get_values(self.instances)
+
+	def get_values(self, instances):
+		cols = self.db_columns
+		return [dict([(col, inst._inst_info.get(col)) for col in cols])
+					for inst in instances]
+
+
+def get_upsert_update_columns(model, columns, conflict_columns):
+	"""Return those of *columns* an upsert of *model* writes to an existing
+	row: neither the *conflict_columns* nor keys assigned by the database.
+	"""
+
+	keys = set(f.column_name for f in model.fields().values() 
+									if f.primary_key or f.auto_increment)
+	return [c for c in columns if c not in conflict_columns and c not in keys]
+
+
+class UpsertQuery(InsertQuery):
+	"""Generates the SQL for inserting the row of *inst*, or, if a row with
+	the same values of the unique *conflict_columns* exists, for updating 
+	its *columns*, all columns by default, instead. Needs SQLite 3.24 for 
+	ON CONFLICT.
+	"""
+
+	def __init__(self, inst, conflict_columns, db=None, columns=None):
+		InsertQuery.__init__(self, inst, db)
+
+		self.conflict_columns = list(conflict_columns)
+		self.update_columns = get_upsert_update_columns(self.model, 
+			self.db_columns if columns is None else columns, 
+			self.conflict_columns)
+
+	def render(self):
+		return "INSERT INTO %s (%s) VALUES (%s) ON CONFLICT (%s) DO NOTHING" % (
+			self.db_table,
+			", ".join(self.db_columns),
+			", ".join(":" + c for c in self.db_columns),
+			", ".join(self.conflict_columns)
+		)
+
+	def render_update(self, returning=False):
+		return "UPDATE %s SET %s WHERE %s%s" % (
+			self.db_table,
+			", ".join("%s=:%s" % (c, c) for c in self.update_columns),
+			self.render_where(),
+			" RETURNING " + self.model.pk.column_name if returning else ""
+		)
+
+	def render_select(self):
+		return "SELECT %s FROM %s WHERE %s" % (self.model.pk.column_name, 
+										self.db_table, self.render_where())
+
+	def render_where(self):
+		return " AND ".join("%s=:%s" % (c, c) for c in self.conflict_columns)
+
+	def execute(self):
+		"""Return a tuple of (primary key of the row, True if it was 
+		inserted). Run in a transaction, so that no other connection writes
+		the row in between the statements.
+		"""
+
+		cursor = self.db.execute(self.render(), self.values)
+		if cursor.rowcount == 1:
+			pk = self.values.get(self.model.pk.column_name)
+			return (cursor.lastrowid if pk is None else pk), True
+
+		if self.update_columns and HAS_RETURNING:
+			return self.db.execute(self.render_update(True), 
+											self.values).fetchone()[0], False
+		if self.update_columns:
+			self.db.execute(self.render_update(), self.values)
+		return self.db.execute(self.render_select(), 
+											self.values).fetchone()[0], False
+
+
+class BulkUpsertQuery(BulkInsertQuery):
+	"""Generates the SQL for upserting many instances of *model*, see 
+	:class:`UpsertQuery`, with one executemany per *batch_size* instances.
+	All columns are written. The instances get the primary keys of their 
+	rows, read back with one query per batch.
+	"""
+
+	def __init__(self, model, instances, conflict_columns, db=None, 
+															batch_size=None):
+		BulkInsertQuery.__init__(self, model, instances, db, batch_size)
+
+		self.conflict_columns = list(conflict_columns)
+		self.update_columns = get_upsert_update_columns(self.model, 
+								self.db_columns, self.conflict_columns)
+
+	def execute(self):
+		stmt = self.render()
+		for batch in self.batches(self.instances):
+			self.db.executemany(stmt, self.get_values(batch))
+			self.set_ids(batch)
+
+	def render(self):
+		if self.update_columns:
+			action = "UPDATE SET " + ", ".join("%s=excluded.%s" % (c, c) 
+												for c in self.update_columns)
+		else:
+			action = "NOTHING"
+		return "INSERT INTO %s (%s) VALUES (%s) ON CONFLICT (%s) DO %s" % (
+			self.db_table,
+			", ".join(self.db_columns),
+			", ".join(":" + c for c in self.db_columns),
+			", ".join(self.conflict_columns),
+			action
+		)
+
+	def set_ids(self, instances):
+		"""Set the primary keys of the rows of *instances* on them, looked 
+		up by their values of the conflict columns.
+		"""
+
+		pkcol = self.model.pk.column_name
+
+		def key(inst):
+			return tuple(inst._inst_info.get(c) for c in self.conflict_columns)
+
+		filter = filter_factory("in")
+		filter.set_values([inst._inst_info.get(self.conflict_columns[0]) 
+												for inst in instances])
+		stmt = "SELECT %s, %s FROM %s WHERE %s %s" % (
+			pkcol,
+			", ".join(self.conflict_columns), 
+			self.db_table,
+			self.conflict_columns[0],
+			filter.render("p0")
+		)
+		pks = dict((tuple(row[1:]), row[0]) for row 
+				in self.db.execute(stmt, dict(filter.get_values("p0"))))
+
+		for inst in instances:
+			inst._inst_info[pkcol] = pks[key(inst)]
+
+
+class BulkUpdateQuery(BaseQuery):
+	"""Generates the SQL for updating the rows of many instances of *model*
+	with a single executemany.
+	"""
+
+	def __init__(self, model, instances, db=None, columns=None):
+		BaseQuery.__init__(self, model, db)
+		self.instances = instances
+
+		pk = self.model.pk.column_name
+		if columns is None:
+			columns = self.db_columns
+		self.columns = [c for c in columns if c != pk]
+
+	def execute(self):
+		return self.db.executemany(*self.as_sql())
+
+	def render(self):
+		pk = self.model.pk.column_name
+		return "UPDATE %s SET %s WHERE %s=:%s" % (self.db_table,
+			", ".join([c + "=:" + c for c in self.columns]), pk, pk)
+
+	def get_values(self):
+		cols = self.columns + [self.model.pk.column_name]
+		return [dict([(col, inst._inst_info.get(col)) for col in cols])
+					for inst in self.instances]
+
+
 class DeleteQuery(BaseQuery):
 	def __init__(self, model, where, db=None):
 		BaseQuery.__init__(self, model, db)
@@ -651,16 +1279,76 @@ class DeleteQuery(BaseQuery):
 		return self.render(), self.where
 
 
+class SelectionDeleteQuery(BaseQuery):
+	"""Generates the SQL for deleting the rows selected by the SelectQuery 
+	*query* with one statement.
+	"""
+
+	def __init__(self, query, db=None):
+		BaseQuery.__init__(self, query.model, db or query._db)
+
+		# Selects the primary keys of the rows.
+		self.selection = query.clone()
+		self.selection.annotation_node.clear()
+		self.selection._aggregate((Select(self.model.pk.column_name),), {})
+
+	def render_where(self):
+		return "WHERE %s IN (%s)" % (self.model.pk.column_name, 
+												self.selection.render())
+
+	def render(self):
+		return "DELETE FROM %s %s" % (self.db_table, self.render_where())
+
+	def get_values(self):
+		return self.selection.get_values()
+
+
+class SelectionUpdateQuery(SelectionDeleteQuery):
+	"""Generates the SQL for setting the columns to the values of the dict
+	*values* in the rows selected by the SelectQuery *query* with one 
+	statement.
+	"""
+
+	def __init__(self, query, values, db=None):
+		SelectionDeleteQuery.__init__(self, query, db)
+		self.columns = sorted(values)
+		self.values = values
+
+	def render(self):
+		return "UPDATE %s SET %s %s" % (
+			self.db_table, 
+			", ".join("%s = :u%i" % (c, i) for i, c in enumerate(self.columns)),
+			self.render_where()
+		)
+
+	def get_values(self):
+		d = self.selection.get_values()
+		for i, c in enumerate(self.columns):
+			d["u%i" % i] = self.values[c]
+		return d
+
+
 class UpdateQuery(BaseQuery):
-	def __init__(self, inst, db=None):
+	"""Generates the SQL for updating the row of *inst*. Only *columns* are
+	written, or all columns if *columns* is None.
+	"""
+
+	def __init__(self, inst, db=None, columns=None):
 		BaseQuery.__init__(self, type(inst), db)
 
 		self.inst = inst
-		self.values = inst.get_column_names_values()
+
+		pk = self.inst.fields()["pk"].column_name
+		if columns is None:
+			columns = self.db_columns
+		self.columns = [c for c in columns if c != pk]
+
+		self.values = dict([(c, inst._inst_info.get(c)) 
+								for c in self.columns + [pk]])
 
 	def render(self):
 		sql = ["UPDATE", self.inst.tablename(), "SET"]
-		sql.append(", ".join([k + "=:" + k for k in self.get_values()]))
+		sql.append(", ".join([k + "=:" + k for k in self.columns]))
 
 		pk = self.inst.fields()["pk"].column_name
 		sql.append("WHERE %s=:%s" %(pk, pk))
@@ -702,7 +1390,7 @@ class LinkerTableInsertQuery(object):
 		
 		self.slaves = slaves
 
-		self.db = db or connection.connect()
+		self._db = db
 
 		self.table = link_table_name(
 			MODES[self.relation.mode], self.relation.model.tablename(),
@@ -711,6 +1399,10 @@ class LinkerTableInsertQuery(object):
 
 		self.db_columns = self.db.table_registry[self.table].columns
 
+	@property
+	def db(self):
+		return self._db or connection.connect()
+
 	def execute(self):
 		self.db.executemany(*self.as_sql())
 
@@ -757,13 +1449,17 @@ class LinkerTableDeleteQuery(object):
 		# deleted.
 		self.slaves = slaves
 
-		self.db = db or connection.connect()
+		self._db = db
 
 		self.table = link_table_name(MODES[self.relation.mode],
 			self.relation.model.tablename(), self.relation.identifier,
 			self.relation.related_model.tablename()
 		)
 
+	@property
+	def db(self):
+		return self._db or connection.connect()
+
 	def execute(self):
 		self.db.execute(*self.as_sql())
 
@@ -771,13 +1467,25 @@ class LinkerTableDeleteQuery(object):
 		self.db.commit()
 
 	def as_sql(self):
-		return self.render(), {}
+		"""The ids are passed as parameters of IN filters, which pack them
+		if there are many.
+		"""
 
-	def render(self):
-		d = self.get_values()
+		conditions = []
+		values = {}
+		for i, (column, ids) in enumerate(sorted(self.get_values().items())):
+			filter = filter_factory("in")
+			filter.set_values(ids)
+			prefix = "p%i" % i
 
-		cols = [c + " IN (%s" %", ".join(map(str, d[c])) + ")" for c in d.keys()]
-		return "DELETE FROM %s WHERE %s;" %(self.table, " AND ".join(cols))
+			conditions.append("%s %s" % (column, filter.render(prefix)))
+			values.update(filter.get_values(prefix))
+
+		return ("DELETE FROM %s WHERE %s;" 
+					% (self.table, " AND ".join(conditions)), values)
+
+	def render(self):
+		return self.as_sql()[0]
 
 	def get_values(self):
 		# if self.relation.is_reverse_by_identifier(self.identifier):
@@ -831,16 +1539,30 @@ class ForeignKeyUpdateQuery(BaseQuery):
 
 
 class Join(object):
-	def __init__(self, relation, identifier):
+	"""Joins the table aliased *left_alias* to the table on the other side
+	of *relation*, which is aliased *right_alias*.
+	"""
+
+	def __init__(self, relation, identifier, left_alias=BASE_ALIAS, 
+														right_alias=None):
 		self.rel = self.relation = relation
 		self.ident = self.identifier = identifier
+		self.left_alias = left_alias
+		self.right_alias = right_alias
 
 	def __eq__(self, other):
-		return self.rel == other.rel and self.ident == other.ident
+		return (self.rel == other.rel and self.ident == other.ident
+				and self.left_alias == other.left_alias)
 
 	def __ne__(self, other):
 		return not self.__eq__(other)
 
+	def __deepcopy__(self, memo):
+		# Joins are never altered after their creation. Sharing them keeps
+		# the table aliases of a copied query consistent with the joins
+		# referenced by its leaves.
+		return self
+
 	def render(self):
 		if self.relation.mode in (M2M, O2O):
 			# Many related mode
@@ -851,17 +1573,17 @@ class Join(object):
 				self.relation.identifier,
 				self.relation.related_model.tablename()
 			)
+			link_alias = self.get_link_table_alias()
 
-			return "%s AS %s LEFT OUTER JOIN %s ON %s.id = %s.%s_id LEFT OUTER JOIN %s AS %s ON %s.%s_id = %s.id" % (
-				self.get_left_side(),
-				self.get_left_side_alias(),
+			return "LEFT OUTER JOIN %s AS %s ON %s.id = %s.%s_id LEFT OUTER JOIN %s AS %s ON %s.%s_id = %s.id" % (
 				link_table,
+				link_alias,
 				self.get_left_side_alias(),
-				link_table,
+				link_alias,
 				self.rel._get_other_identifier(self.identifier),
 				self.get_right_side(),
 				self.get_right_side_alias(),
-				link_table,
+				link_alias,
 				self.ident,
 				self.get_right_side_alias()
 			)
@@ -884,9 +1606,7 @@ class Join(object):
 
 			assert (fk_field_on_base_table is not None), (self.ident, self.rel.model.fields(), self.rel.related_model.fields())
 
-			return "%s AS %s LEFT OUTER JOIN %s AS %s ON %s.%s = %s.id" % (
-				self.get_left_side(),
-				self.get_left_side_alias(),
+			return "LEFT OUTER JOIN %s AS %s ON %s.%s = %s.id" % (
 				self.get_right_side(),
 				self.get_right_side_alias(),
 				base_table,
@@ -902,7 +1622,7 @@ class Join(object):
 	def get_left_side_alias(self):
 		"""The alias for the left table of the join."""
 
-		return "%s_%i" % (self.get_left_side(), id(self))
+		return self.left_alias
 
 	def get_right_side(self):
 		if self.rel.is_reverse_by_identifier(self.ident):
@@ -912,12 +1632,20 @@ class Join(object):
 	def get_right_side_alias(self):
 		"""The alias for the right table of the join."""
 		
-		return "%s_%i" % (self.get_right_side(), id(self))
+		return self.right_alias
+
+	def get_link_table_alias(self):
+		"""The alias for the linker table of a many-to-many or one-to-one 
+		join.
+		"""
+
+		return "l" + self.right_alias[1:]
 
 
 class SelectionLeaf(object):
-	def __init__(self, join, db_table, db_column, alias=None, function=""):
-		self.join = join
+	def __init__(self, table_alias, db_table, db_column, alias=None, 
+																function=""):
+		self.table_alias = table_alias
 		
 		self.db_table = db_table
 		self.db_column = db_column
@@ -932,10 +1660,10 @@ class SelectionLeaf(object):
 	def __eq__(self, other):
 		return (
 			type(self) == type(other)
-			and self.join == other.join
+			and self.table_alias == other.table_alias
 			and self.db_table == other.db_table
 			and self.db_column == other.db_column
-			and self._alias == other._alias
+			and self.alias == other.alias
 			and self.function == other.function
 		)
 
@@ -944,7 +1672,7 @@ class SelectionLeaf(object):
 
 	def __deepcopy__(self, memo):
 		return SelectionLeaf(
-			self.join,
+			self.table_alias,
 			self.db_table,
 			self.db_column,
 			self.alias,
@@ -952,10 +1680,7 @@ class SelectionLeaf(object):
 		)
 
 	def get_table_alias(self):
-		if self.join is not None:
-			return self.join.get_left_side_alias()
-		else:
-			return self.db_table
+		return self.table_alias
 
 	def render(self):
 		return self.function.upper() +\
@@ -966,9 +1691,9 @@ class SelectionLeaf(object):
 
 
 class WhereLeaf(object):
-	def __init__(self, join, db_table, db_column, filter, value):
+	def __init__(self, table_alias, db_table, db_column, filter, value):
 
-		self.join = join
+		self.table_alias = table_alias
 
 		self.db_table = db_table
 		self.db_column = db_column
@@ -984,7 +1709,7 @@ class WhereLeaf(object):
 	def __deepcopy__(self, memo):
 		# only compound objects need to be deepcopied
 		return WhereLeaf(
-			self.join,				# no need for a deep copy
+			self.table_alias,		# not a compound object
 			self.db_table,			# not a compound object
 			self.db_column,			# not a compound object
 			deepcopy(self.filter),	# compound object
@@ -994,7 +1719,7 @@ class WhereLeaf(object):
 	def __eq__(self, other):
 		return (
 			type(self) == type(other)
-			and self.join == other.join
+			and self.table_alias == other.table_alias
 			and self.db_table == other.db_table
 			and self.db_column == other.db_column
 		)
@@ -1003,33 +1728,21 @@ class WhereLeaf(object):
 		return not self.__eq__(other)
 
 	def get_table_alias(self):
-		if self.join is not None:
-			if self.join.rel.model.tablename() == self.db_table:
-				model = self.join.rel.model
-			elif self.join.rel.related_model.tablename() == self.db_table:
-				model = self.join.rel.related_model
-			else:
-				return self.db_table
-
-			if self.join.rel.is_self_related():
-				return self.join.get_right_side_alias()
+		return self.table_alias
 
-			self.db_table = "%s_%i" % (model.tablename(), id(self.join))
-
-		return self.db_table
+	def get_values(self, prefix):
+		"""Return the (name, value) pairs of the parameters, named by 
+		*prefix*, which is given by the query rendering this leaf.
+		"""
 
-	def get_values(self):
-		return self.filter.get_values(self.get_table_alias(), self.db_column)
+		return self.filter.get_values(prefix)
 		
-	def render(self):
+	def render(self, prefix):
 		return ("%s%s%s %s" % (
 				self.get_table_alias(),
 				"."*bool(self.get_table_alias()),
 				self.db_column,
-				self.filter.render(
-					self.get_table_alias() or "Annotated",
-					self.db_column,
-				)
+				self.filter.render(prefix)
 			)
 		)
 
@@ -1060,18 +1773,22 @@ class OrderByLeaf(object):
 	def __deepcopy__(self, memo):
 		return OrderByLeaf(
 			self.model,
-			"-"*self.desc + self.db_column
+			"-"*self.desc + self.token
 		)
 
 	def toggle(self):
 		self.desc = not self.desc
 
 	def render(self):
-		return "%s.%s %s" %(self.db_table, self.db_column,
+		return "%s.%s %s" %(BASE_ALIAS, self.db_column,
 										"DESC" if self.desc else "ASC")
 
 
 class LimitLeaf(object):
+	# The limit and offset are passed as parameters, so that queries 
+	# differing only in them render the same SQL.
+	param_names = ("heinzel_limit", "heinzel_offset")
+
 	def __init__(self, limit=None, offset=None):
 		if limit is None:
 			limit = sys.maxint
@@ -1085,8 +1802,46 @@ class LimitLeaf(object):
 		return LimitLeaf(self.limit, self.offset)
 
 	def render(self):
-		if self.limit:
-			s = "LIMIT %s" % self.limit
-		if self.offset:
-			s += " OFFSET %s" % self.offset
-		return s
+		return "LIMIT :%s OFFSET :%s" % self.param_names
+
+	def get_values(self):
+		return dict(zip(self.param_names, (self.limit, self.offset)))
+
+
+class SeekLeaf(object):
+	"""Selects the rows that follow the row with *values* for *db_columns* 
+	in the ordering by *db_columns*, where *descs* tells which of them are
+	descending.
+	"""
+
+	def __init__(self, db_columns, descs, values):
+		self.db_columns = db_columns
+		self.descs = descs
+		self.values = values
+
+	def __deepcopy__(self, memo):
+		return SeekLeaf(self.db_columns, self.descs, self.values)
+
+	def get_param_names(self):
+		return ["heinzel_seek_%i" % i for i in range(len(self.values))]
+
+	def render(self):
+		columns = ["%s.%s" % (BASE_ALIAS, c) for c in self.db_columns]
+		params = [":" + n for n in self.get_param_names()]
+		ops = ["<" if desc else ">" for desc in self.descs]
+
+		if len(set(ops)) == 1:
+			# All in one direction, a row value comparison can use an index.
+			return "(%s) %s (%s)" % (", ".join(columns), ops[0], 
+														", ".join(params))
+
+		# (a > :a) OR (a = :a AND b < :b) OR ...
+		terms = []
+		for i, (column, op, param) in enumerate(zip(columns, ops, params)):
+			equal = ["%s = %s" % cp for cp in zip(columns[:i], params[:i])]
+			terms.append("(%s)" % " AND ".join(
+				equal + ["%s %s %s" % (column, op, param)]))
+		return "(%s)" % " OR ".join(terms)
+
+	def get_values(self):
+		return dict(zip(self.get_param_names(), self.values))
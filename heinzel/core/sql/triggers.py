@@ -88,7 +88,9 @@ def trigger_name(mode, ptable, rtable, keycol):
 
 def create_triggers(relation):
 	"""
-	A wrapper for TriggerGenFK and TriggerGenM2M.
+	A wrapper for TriggerGenFK and TriggerGenM2M. Used by syncdb unless
+	it declares foreign key constraints instead, see 
+	`heinzel.core.sql.ddl.create_or_alter_relation_table`.
 	No triggers are required for one-to-one relations because they
 	are already present in the linker table definition via the `UNIQUE`
 	keyword. See `heinzel.core.sql.ddl._sql_stmt__create_link_table`.
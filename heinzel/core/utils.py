@@ -272,8 +272,10 @@ class Node(object):
 
 		if self.connector == node.connector == conn and not node.negate:
 			self.extend(node)
-		else:			
-			clone = deepcopy(self, {})
+		else:
+			# The children are not altered by appending, so they may be 
+			# shared by self's former and new content.
+			clone = Node(self.children, self.connector, self.negate)
 			self.children = [Node([clone, node], conn)]
 			self.negate = False
 			
@@ -2,18 +2,25 @@
 from heinzel.core import exceptions
 from heinzel.core import relations
 from heinzel.core.sql.ddl import (TableCreation,
-	create_or_alter_relation_table, _sql_stmt__create_link_table)
+	create_or_alter_relation_table, _sql_stmt__create_link_table,
+	create_indexes, create_relation_indexes)
 	
 from heinzel.core.sql.triggers import create_triggers
 
 from heinzel import settings
 
 
-def syncdb(models, dbname, force_create_table=True):
+def syncdb(models, dbname, force_create_table=True, integrity=None):
 	"""This will create all necessary tables for the *models* in the database
-	*dbname* and validate those tables.
+	*dbname* and validate those tables. *integrity* is either "triggers" or
+	"foreign_keys" and defaults to settings.REFERENTIAL_INTEGRITY, see there.
 	"""
 
+	integrity = integrity or settings.REFERENTIAL_INTEGRITY
+	if integrity not in ("triggers", "foreign_keys"):
+		raise ValueError("integrity must be 'triggers' or 'foreign_keys', "
+											"not %r." % integrity)
+
 	db = connection.connect(dbname)
 
 	for m in models:
@@ -52,7 +59,8 @@ def syncdb(models, dbname, force_create_table=True):
 				break
 
 	for rel in to_be_installed:
-		relsql = create_or_alter_relation_table(rel)
+		relsql = create_or_alter_relation_table(rel, 
+										integrity == "foreign_keys")
 		try:
 			msg = (
 				"Created or altered table for relation '%s': %s."
@@ -73,20 +81,37 @@ def syncdb(models, dbname, force_create_table=True):
 			# logging.log(msg)
 			print msg
 
+	if integrity == "triggers":
+		for rel in to_be_installed:
+			trglist = create_triggers(rel)
+			for trg in trglist:
+				try:
+					db.execute(trg)
+
+					msg = "Created trigger for relation '%s': %s." % (rel, trg)
+				except Exception, e:
+					if "trigger" in str(e) and "already exists" in str(e):
+						print e
+					else:
+						msg = ("Error on creating trigger for relation '%s': %s"
+							%(rel, e))
+						raise exceptions.SQLSyntaxError(msg)
+
+	# Create the indexes declared on the models and those to look up 
+	# related rows by.
+	idxlist = []
+	for m in models:
+		idxlist.extend(create_indexes(m))
 	for rel in to_be_installed:
-		trglist = create_triggers(rel)
-		for trg in trglist:
-			try:
-				db.execute(trg)
-
-				msg = "Created trigger for relation '%s': %s." % (rel, trg)
-			except Exception, e:
-				if "trigger" in str(e) and "already exists" in str(e):
-					print e
-				else:
-					msg = ("Error on creating trigger for relation '%s': %s"
-						%(rel, e))
-					raise exceptions.SQLSyntaxError(msg)
+		idxlist.extend(create_relation_indexes(rel, 
+										integrity == "foreign_keys"))
+
+	for idx in idxlist:
+		try:
+			db.execute(idx)
+		except Exception, e:
+			msg = "Error on creating index: %s: %s" % (idx, e)
+			raise exceptions.SQLSyntaxError(msg)
 
 	for m in models:
 		db.validate_table(m)
@@ -12,14 +12,33 @@ DBNAME = "test.db"
 DB_SAVE_PATH = os.path.abspath(__file__)
 CACHE = True
 MAX_CACHE = 1000
+# Number of rows fetched from a cursor at a time when iterating over a
+# QuerySet.
+QUERY_CHUNK_SIZE = 100
+# Number of compiled SELECT statements kept for reuse by queries of the
+# same shape.
+COMPILED_QUERY_CACHE_SIZE = 500
+# Number of instances inserted with one executemany by Manager.bulk_create.
+BULK_BATCH_SIZE = 1000
+# IN filters with more values than this pass them as one JSON array to
+# SQLite's json_each, to stay below the limit of parameters per statement.
+MAX_IN_PARAMETERS = 500
 FORCE_CREATE_TABLE = True
+# How syncdb enforces the integrity of relations: "triggers" creates 
+# triggers checking every insert, update and delete, "foreign_keys" 
+# declares SQLite's own FOREIGN KEY and UNIQUE constraints instead.
+REFERENTIAL_INTEGRITY = "triggers"
+# Maximum number of connections opened by the connection pool, and seconds
+# to wait for one of them to be returned when all are in use.
+POOL_SIZE = 10
+POOL_TIMEOUT = 30.0
 
 # A RelationField's related_name will be set to RELATED_NAME_PREFIX +
 # model_class.__name__.lower() + RELATED_NAME_POSTFIX by default
 RELATED_NAME_PREFIX = ""
 RELATED_NAME_POSTFIX = "_set"
-
-
+
+
 ## XXX: unused?
 ###########################    heinzel    #########################
 ##                       !DO NOT INTERFERE!                      ##
@@ -165,10 +165,144 @@ class Offset(Fixture):
 		)
 
 
+class BatchCull(Fixture):
+	"""
+	With ‘‘cull_n‘‘ > 1, the cache culls that many of the least recently
+	used entries at once.
+	"""
+
+	def runTest(self):
+		from heinzel.core.cache import MRUCache
+		from heinzel.core.info import get_inst_info
+
+		cache = MRUCache(max_size=10, cull_n=4)
+		pics = [Picture(path="/some/path/%i" % i) for i in xrange(11)]
+		infos = [get_inst_info(p) for p in pics]
+
+		for inf in infos[:10]:
+			cache.add(inf)
+		self.assert_(cache.filling_level() == 1.0)
+
+		# Touching moves an entry to the end of the culling order.
+		cache.touch(infos[0])
+		self.assert_(cache._order.keys() == infos[1:10] + [infos[0]])
+
+		cache.add(infos[10])
+		self.assert_(cache._order.keys() == infos[5:10] + [infos[0], infos[10]])
+		self.assert_(set(cache._instances.values()) 
+						== set(pics[5:11] + [pics[0]]))
+
+		cache.cull_expendables(2)
+		self.assert_(cache._order.keys() == infos[7:10] + [infos[0], infos[10]])
+
+		cache.remove(infos[0])
+		self.assert_(infos[0] not in cache)
+		self.assert_(cache.filling_level() == 0.4)
+
+
+class Policies(Fixture):
+	"""
+	The eviction policies decide which entry a PolicyCache culls next.
+	"""
+
+	def runTest(self):
+		from heinzel.core.cache import (LRUPolicy, LFUPolicy, ARCPolicy,
+			TTLPolicy)
+
+		lru = LRUPolicy()
+		for k in "abcd":
+			lru.insert(k)
+		lru.touch("a")
+		lru.discard("c")
+		self.assert_([lru.evict() for i in xrange(3)] == ["b", "d", "a"])
+
+		# Least frequently used first, ties are broken by age.
+		lfu = LFUPolicy()
+		for k in "abcd":
+			lfu.insert(k)
+		for k in "abacab":
+			lfu.touch(k)
+		lfu.discard("d")
+		self.assert_([lfu.evict() for i in xrange(3)] == ["c", "b", "a"])
+		self.assert_(len(lfu) == 0)
+
+		# Keys seen once are evicted before keys seen more than once ...
+		arc = ARCPolicy()
+		arc.capacity = 3
+		for k in "abc":
+			arc.insert(k)
+		arc.touch("a")
+		self.assert_(arc.evict() == "b")
+		# ... until a ghost of such a key is hit. Then the list of keys seen
+		# once is allowed to grow.
+		arc.insert("b")
+		self.assert_("b" in arc and arc._p == 1)
+		arc.insert("d")
+		self.assert_(arc.evict() == "c")
+		self.assert_(arc.evict() == "a")
+
+		now = [0.0]
+		ttl = TTLPolicy(ttl=10, clock=lambda: now[0])
+		ttl.insert("a")
+		now[0] = 5.0
+		ttl.insert("b")
+		self.assert_(ttl.expired() == [])
+		now[0] = 12.0
+		self.assert_(ttl.expired() == ["a"])
+		ttl.touch("a")
+		self.assert_(ttl.evict() == "a")
+
+
+class StorageWithPolicy(Fixture):
+	"""
+	A Storage can be given an eviction policy for its cache.
+	"""
+
+	def setUp(self):
+		from heinzel.core.cache import PolicyCache, LFUPolicy
+		from heinzel.core.queries import Storage
+
+		max_cache, settings.MAX_CACHE = settings.MAX_CACHE, 5
+		try:
+			policy_store = Storage(cache=LFUPolicy())
+		finally:
+			settings.MAX_CACHE = max_cache
+
+		self.assert_(type(policy_store._cache) is PolicyCache)
+		self.assert_(isinstance(policy_store._cache.policy, LFUPolicy))
+		self.assert_(policy_store._cache.max_size == 5)
+
+		# The managers query the module's storage, which gets the cache.
+		self.cache = store._cache
+		store._cache = policy_store._cache
+		super(StorageWithPolicy, self).setUp()
+
+	def tearDown(self):
+		store._cache = self.cache
+		super(StorageWithPolicy, self).tearDown()
+
+	def runTest(self):
+		pics = []
+		for i in xrange(5):
+			pics.append(Picture(path="/some/path/%i" % i).save()[0])
+
+		# Access all but the first picture.
+		self.assert_(list(Picture.objects.filter(id__gt=1)) == pics[1:])
+
+		pic5 = Picture(path="/some/path/5").save()[0]
+
+		# The least frequently used picture was culled.
+		self.assert_(set(store._cache._instances.values())
+						== set(pics[1:] + [pic5]))
+
+
 if __name__ == "__main__":
 	alltests = (
 		CullTest,
 		Offset,
+		BatchCull,
+		Policies,
+		StorageWithPolicy,
 	)
 
 	runtests(tests=alltests, verbosity=3)
\ No newline at end of file
@@ -2,14 +2,19 @@
 
 import os
 import unittest
+import sqlite3
+import threading
+import time
 
 # use a different dbname
 from heinzel import settings
 settings.DBNAME = "othername.db"
 
 
-from heinzel.core import models
+from heinzel.core import models, connection
 from heinzel.core import exceptions
+from heinzel.core.info import get_inst_info
+from heinzel.core.queries import storage
 from utils import Fixture, runtests, stopwatch
 
 # Import the models.
@@ -27,10 +32,336 @@ class ConnTest(Fixture):
 			Actor.objects.create(name="actor_%i" % i)
 		
 
+class TransactionTest(Fixture):
+	"""
+	Show that:
+	1. Saves inside a transaction are committed on leaving it.
+	2. Nested transactions are rolled back on their own.
+	3. Transactions can decorate functions.
+	"""
+
+	def count(self):
+		# Another connection only sees committed rows.
+		other = sqlite3.connect(settings.DBNAME)
+		try:
+			return other.execute("SELECT count(*) FROM %s" 
+				% Actor.tablename()).fetchone()[0]
+		finally:
+			other.close()
+
+	def runTest(self):
+		db = connection.connect()
+
+		with db.transaction():
+			for i in xrange(10):
+				Actor.objects.create(name="actor_%i" % i)
+			self.assert_(db.in_transaction())
+			self.assert_(self.count() == 0)
+
+		self.assert_(not db.in_transaction())
+		self.assert_(self.count() == 10)
+
+		with db.transaction():
+			Actor.objects.create(name="outer")
+			try:
+				with db.transaction():
+					Actor.objects.create(name="inner")
+					raise ValueError
+			except ValueError:
+				pass
+		self.assert_(self.count() == 11)
+
+		@db.transaction
+		def create_and_fail():
+			Actor.objects.create(name="failed")
+			raise ValueError
+
+		self.assertRaises(ValueError, create_and_fail)
+		self.assert_(not db.in_transaction())
+		self.assert_(self.count() == 11)
+
+
+class AbortedTransactionTest(TransactionTest):
+	"""
+	Show that:
+	1. A trigger rolling back the whole transaction inside nested
+	transactions leaves them with the trigger's error, and the connection
+	as it was before.
+	2. A transaction that goes on after a nested one was rolled back by a
+	trigger is rolled back as a whole and raises TransactionAborted.
+	"""
+
+	def runTest(self):
+		db = connection.connect()
+		isolation_level = db.conn.isolation_level
+
+		# Violates the foreign key triggers of the link table.
+		link = ("INSERT INTO m2m__actors__acted_in__movies "
+				"VALUES (null, 1000, 1000)")
+
+		def nested():
+			with db.transaction():
+				Actor.objects.create(name="outer")
+				with db.transaction():
+					Actor.objects.create(name="inner")
+					db.execute(link)
+
+		self.assertRaises(exceptions.DatabaseSanityError, nested)
+		self.assert_(not db.in_transaction())
+		self.assert_(db.conn.isolation_level == isolation_level)
+		self.assert_(self.count() == 0)
+
+		def going_on():
+			with db.transaction():
+				Actor.objects.create(name="outer")
+				try:
+					with db.transaction():
+						db.execute(link)
+				except exceptions.DatabaseSanityError:
+					pass
+				Actor.objects.create(name="after")
+
+		self.assertRaises(exceptions.TransactionAborted, going_on)
+		self.assert_(not db.in_transaction())
+		self.assert_(db.conn.isolation_level == isolation_level)
+		self.assert_(self.count() == 0)
+
+		with db.transaction():
+			Actor.objects.create(name="later")
+		self.assert_(not db.is_aborted())
+		self.assert_(self.count() == 1)
+
+
+class RolledBackSaveTest(TransactionTest):
+	"""
+	Show that:
+	1. Instances created inside a rolled back transaction lose their 
+	primary keys again, and are inserted later on.
+	2. Changes saved inside a rolled back transaction are unsaved again.
+	3. What was saved in an enclosing transaction is kept.
+	"""
+
+	def names(self):
+		other = sqlite3.connect(settings.DBNAME)
+		try:
+			return sorted(row[0] for row in other.execute(
+				"SELECT name FROM %s" % Actor.tablename()))
+		finally:
+			other.close()
+
+	def runTest(self):
+		db = connection.connect()
+		cage, created = Actor.objects.create(name="Cage")
+
+		with db.transaction():
+			kept, created = Actor.objects.create(name="Kept")
+			try:
+				with db.transaction():
+					lost, created = Actor.objects.create(name="Lost")
+					cage.name = "Nicolas Cage"
+					cage.save()
+					raise ValueError
+			except ValueError:
+				pass
+
+			self.assert_(lost.pk is None and kept.pk is not None)
+			self.assert_(cage.name == "Nicolas Cage")
+
+		self.assert_(self.names() == ["Cage", "Kept"])
+
+		# Queries save the unsaved instances and changes first.
+		self.assert_(len(Actor.objects.all()) == 3)
+		self.assert_(lost.pk is not None)
+		self.assert_(self.names() == ["Kept", "Lost", "Nicolas Cage"])
+
+
+class ThreadChangesTest(RolledBackSaveTest):
+	"""
+	Show that:
+	1. The queries of a thread save only the changes made by that thread.
+	2. A rollback in one thread keeps the changes of other threads.
+	"""
+
+	def runTest(self):
+		cage, created = Actor.objects.create(name="Cage")
+		cage.name = "Nicolas Cage"
+		results = []
+
+		def work():
+			db = connection.connect()
+			try:
+				with db.transaction():
+					results.append(len(Actor.objects.all()))
+					results.append(db.execute("SELECT name FROM %s" 
+						% Actor.tablename()).fetchall())
+					raise ValueError
+			except ValueError:
+				pass
+
+		t = threading.Thread(target=work)
+		t.start()
+		t.join()
+
+		self.assert_(results == [1, [("Cage",)]])
+		self.assert_(get_inst_info(cage) in storage._dirty)
+		self.assert_(self.names() == ["Cage"])
+
+		self.assert_(len(Actor.objects.all()) == 1)
+		self.assert_(self.names() == ["Nicolas Cage"])
+
+
+class ThreadSyncTest(RolledBackSaveTest):
+	"""
+	Show that:
+	1. A query in another thread does not overwrite unsaved changes.
+	"""
+
+	def runTest(self):
+		Actor.objects.create(name="A")
+		a = Actor.objects.get(name="A")
+		a.name = "B"
+		results = []
+
+		def work():
+			results.append([actor.name for actor in Actor.objects.all()])
+
+		t = threading.Thread(target=work)
+		t.start()
+		t.join()
+
+		self.assert_(results == [["B"]])
+		self.assert_(a.name == "B")
+
+		a.save()
+		self.assert_(self.names() == ["B"])
+
+
+class ThreadTransactionTest(TransactionTest):
+	"""
+	Show that:
+	1. connection.transaction runs on the database of the thread entering
+	it.
+	"""
+
+	def runTest(self):
+		main_db = connection.connect()
+		results = []
+
+		@connection.transaction
+		def create(name):
+			db = connection.connect()
+			Actor.objects.create(name=name)
+			results.append((db, db.in_transaction(), 
+							main_db.in_transaction()))
+
+		t = threading.Thread(target=create, args=("Cage",))
+		t.start()
+		t.join()
+
+		thread_db, in_transaction, in_main_transaction = results.pop()
+		self.assert_(thread_db is not main_db)
+		self.assert_(in_transaction and not in_main_transaction)
+		self.assert_(not thread_db.in_transaction())
+		self.assert_(self.count() == 1)
+
+		create("Nicolas Cage")
+		db, in_transaction, in_main_transaction = results.pop()
+		self.assert_(db is main_db and in_transaction)
+		self.assert_(not main_db.in_transaction())
+		self.assert_(self.count() == 2)
+
+
+class PoolTest(Fixture):
+	"""
+	Show that:
+	1. A pool hands out at most max_size databases at a time.
+	2. Each thread gets a database of its own.
+	3. A thread's database goes back to the pool when the thread ends.
+	"""
+
+	def runTest(self):
+		pool = connection.Pool(max_size=2, timeout=0.1)
+
+		a = pool.checkout()
+		b = pool.checkout()
+		self.assert_(a is not b and a.conn is not b.conn)
+		self.assert_(a.table_registry is b.table_registry)
+		self.assert_(Actor.tablename() in a.table_registry)
+		self.assertRaises(exceptions.DatabaseError, pool.checkout)
+
+		pool.checkin(a)
+		self.assert_(pool.checkout() is a)
+
+		# Closed databases are not handed out again.
+		a.close()
+		pool.checkin(a)
+		c = pool.checkout()
+		self.assert_(c is not a and c is not b)
+
+		Actor.objects.create(name="Cage")
+
+		main_db = connection.connect()
+		results = []
+
+		def work():
+			results.append((connection.connect(), 
+							len(Actor.objects.all())))
+
+		t = threading.Thread(target=work)
+		t.start()
+		t.join()
+
+		thread_db, count = results.pop()
+		self.assert_(thread_db is not main_db)
+		self.assert_(count == 1)
+
+		# The thread's local data is released shortly after join returns.
+		for i in xrange(100):
+			if thread_db in connection.pool._idle:
+				break
+			time.sleep(0.01)
+		self.assert_(thread_db in connection.pool._idle)
+
+		connection.pool.release()
+		self.assert_(main_db in connection.pool._idle)
+		self.assert_(connection.connect() in (main_db, thread_db))
+
+class IntrospectionTest(Fixture):
+	"""
+	Show that:
+	1. Tables are introspected again only when the schema has changed.
+	"""
+
+	def runTest(self):
+		db = connection.connect()
+		registry = db.table_registry
+		table = registry[Actor.tablename()]
+		self.assert_(set(table.columns) == set(Actor.get_column_names()))
+
+		db.connect()
+		self.assert_(db.table_registry is registry)
+		self.assert_(registry[Actor.tablename()] is table)
+
+		other = sqlite3.connect(settings.DBNAME)
+		other.execute("CREATE TABLE extra (id INTEGER, \"odd name\" TEXT)")
+		other.close()
+
+		db.register_tables()
+		self.assert_(registry["extra"].columns == ["id", "odd name"])
+		self.assert_(registry[Actor.tablename()] is not table)
+
 
 if __name__ == "__main__":
 	alltests = (
 		ConnTest,
+		TransactionTest,
+		AbortedTransactionTest,
+		RolledBackSaveTest,
+		ThreadChangesTest,
+		ThreadSyncTest,
+		ThreadTransactionTest,
+		PoolTest,
+		IntrospectionTest,
 	)
 
 	runtests(tests=alltests, verbosity=3)
\ No newline at end of file
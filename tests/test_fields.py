@@ -3,6 +3,7 @@ import datetime
 
 from utils import Fixture, runtests
 
+from heinzel import settings
 from heinzel.core import models
 from heinzel.core.utils import datetime_localize
 
@@ -75,6 +76,25 @@ class TestDatetimeField(Fixture):
 		self.assert_(compdt1 < corv.build_date < compdt2)
 
 
+class TestDatetimeFieldIn(Fixture):
+	"""
+	Show that:
+	1. Filtering datetimes by long IN lists finds the same rows as by 
+	short ones.
+	"""
+
+	def runTest(self):
+		start = datetime.datetime(2020, 1, 1, 12)
+		dates = [start + datetime.timedelta(minutes=i) 
+					for i in range(settings.MAX_IN_PARAMETERS + 1)]
+		Car.objects.bulk_create([Car(build_date=d) for d in dates])
+
+		qs = Car.objects.filter(build_date__in=dates)
+		self.assert_("json_each" in qs.query.render())
+		self.assert_(len(qs) == len(dates))
+		self.assert_(len(Car.objects.filter(build_date__in=dates[:10])) == 10)
+
+
 class TestIPv6Field(Fixture):
 	def runTest(self):
 		import socket
@@ -91,6 +111,7 @@ if __name__ == "__main__":
 		TestFieldInitial,
 		TestFloatFieldInitial,
 		TestDatetimeField,
+		TestDatetimeFieldIn,
 		TestIPv6Field
 	)
 
@@ -6,7 +6,7 @@ below."""
 from utils import Fixture, runtests
 
 from model_examples import Car, Brand, Manufacturer, Driver, Key
-from heinzel.core import models
+from heinzel.core import models, connection
 
 models.register([Manufacturer, Brand, Car, Driver, Key])
 
@@ -244,6 +244,162 @@ class Remove(Fixture):
 		self.assert_(list(vw.car_set) == [bulli, kaefer])
 		
 
+class ChainedLookups(Fixture):
+	"""
+	Show that:
+	1. Lookups may span several relations, in both directions.
+	2. Identical querysets render identical SQL.
+	"""
+
+	def runTest(self):
+		vwgruppe = Manufacturer(name="VWGruppe")
+		vwgruppe.save()
+		daimler = Manufacturer(name="Daimler")
+		daimler.save()
+
+		vw = Brand(name="VW")
+		vw.save()
+		vw.manufacturer = vwgruppe
+		mercedes = Brand(name="Mercedes")
+		mercedes.save()
+		mercedes.manufacturer = daimler
+
+		golf = Car(name="Golf")
+		golf.save()
+		golf.brand = vw
+		sprinter = Car(name="Sprinter")
+		sprinter.save()
+		sprinter.brand = mercedes
+
+		self.assert_(list(Car.objects.filter(
+			brand__manufacturer__name="Daimler")) == [sprinter])
+		self.assert_(list(Car.objects.filter(brand__name="VW",
+			brand__manufacturer__name="VWGruppe")) == [golf])
+		self.assert_(list(Manufacturer.objects.filter(
+			brand_set__car_set__name="Golf")) == [vwgruppe])
+
+		q1 = Car.objects.filter(brand__manufacturer__name="Daimler").query
+		q2 = Car.objects.filter(brand__manufacturer__name="Daimler").query
+		self.assert_(q1.render() == q2.render())
+		self.assert_(q1.get_values() == q2.get_values())
+
+
+class SelectRelated(Fixture):
+	"""
+	Show that:
+	1. Instances selected with select_related are accessible through their 
+	foreign keys without further queries.
+	2. Changing the foreign key still takes effect.
+	"""
+
+	def runTest(self):
+		vwgruppe = Manufacturer(name="VWGruppe")
+		vwgruppe.save()
+
+		vw = Brand(name="VW")
+		vw.save()
+		vw.manufacturer = vwgruppe
+		mercedes = Brand(name="Mercedes")
+		mercedes.save()
+
+		golf = Car(name="Golf")
+		golf.save()
+		golf.brand = vw
+		sprinter = Car(name="Sprinter")
+		sprinter.save()
+		sprinter.brand = mercedes
+		trabant = Car(name="Trabant")
+		trabant.save()
+
+		cars = list(Car.objects.all().select_related("brand__manufacturer"))
+		self.assert_(cars == [golf, sprinter, trabant])
+
+		# Count the statements executed from here on.
+		db = connection.connect()
+		statements = []
+		execute = db.execute
+		def counting_execute(stmt, *args):
+			statements.append(stmt)
+			return execute(stmt, *args)
+		db.execute = counting_execute
+
+		try:
+			self.assert_(golf.brand is vw)
+			self.assert_(golf.brand.manufacturer is vwgruppe)
+			self.assert_(sprinter.brand is mercedes)
+			self.assert_(sprinter.brand.manufacturer is None)
+			self.assert_(trabant.brand is None)
+			self.assert_(not statements)
+
+			trabant.brand = vw
+			self.assert_(trabant.brand is vw)
+			self.assert_(statements)
+		finally:
+			del db.execute
+
+		self.assert_(
+			Car.objects.filter(name="Golf").select_related("brand").query
+			.render().count("LEFT OUTER JOIN") == 1
+		)
+		self.assertRaises(ValueError, Car.objects.all().select_related, "name")
+
+
+class PrefetchRelated(Fixture):
+	"""
+	Show that:
+	1. The instances pointing to those of a QuerySet are selected at once by
+	QuerySet.prefetch_related.
+	2. So are those of a slice of a QuerySet.
+	"""
+
+	def runTest(self):
+		vw = Brand(name="VW")
+		vw.save()
+		mercedes = Brand(name="Mercedes")
+		mercedes.save()
+		trabant = Brand(name="Trabant")
+		trabant.save()
+
+		golf = Car(name="Golf")
+		golf.save()
+		golf.brand = vw
+		bulli = Car(name="Bulli")
+		bulli.save()
+		bulli.brand = vw
+		sprinter = Car(name="Sprinter")
+		sprinter.save()
+		sprinter.brand = mercedes
+
+		db = connection.connect()
+		statements = []
+		execute = db.execute
+		def counting_execute(stmt, *args):
+			statements.append(stmt)
+			return execute(stmt, *args)
+		db.execute = counting_execute
+
+		try:
+			page = Brand.objects.all().prefetch_related("car_set")[0:2]
+			self.assert_(page == [vw, mercedes])
+			self.assert_(len(statements) == 2)
+			self.assert_(list(vw.car_set) == [golf, bulli])
+			self.assert_(list(mercedes.car_set) == [sprinter])
+			self.assert_(len(statements) == 2)
+
+			brands = Brand.objects.all().prefetch_related("car_set")
+			self.assert_(list(brands) == [vw, mercedes, trabant])
+			del statements[:]
+
+			self.assert_(list(vw.car_set) == [golf, bulli])
+			self.assert_(list(mercedes.car_set) == [sprinter])
+			self.assert_(len(trabant.car_set) == 0)
+			self.assert_(not statements)
+		finally:
+			del db.execute
+
+		self.assertRaises(ValueError, Car.objects.all().prefetch_related,
+																	"brand")
+
 
 if __name__ == "__main__":
 	alltests = (
@@ -253,6 +409,9 @@ if __name__ == "__main__":
 		Add,
 		Delete,
 		Remove,
+		ChainedLookups,
+		SelectRelated,
+		PrefetchRelated,
 	)
 
 	runtests(tests=alltests, verbosity=3)
\ No newline at end of file
@@ -6,7 +6,7 @@ below."""
 from utils import Fixture, runtests
 
 from model_examples import Actor, Movie, Car, Brand, Manufacturer, Driver, Key
-from heinzel.core import models, exceptions
+from heinzel.core import models, exceptions, connection
 
 
 models.register([Actor, Movie])
@@ -165,11 +165,67 @@ class get_set_delete(Fixture):
 		self.assert_((list(Actor.objects.get(name="Schwarzenegger").acted_in.all())
 						== [totalrecall, predator]))
 
+class prefetch_related(Fixture):
+	"""
+	Show that:
+	1. The related instances of a whole QuerySet are selected at once by 
+	QuerySet.prefetch_related and read from memory by the relation managers.
+	2. Changing the relation takes effect.
+	"""
+
+	def runTest(self):
+		terminator, created = Movie(title="Terminator 2").save()
+		totalrecall, created, = Movie(title="Total Recall").save()
+		twins, created  = Movie(title="Twins").save()
+
+		arnold, created= Actor(name="Schwarzenegger").save()
+		danny, created = Actor(name="De Vito").save()
+		sigourney, created = Actor(name="Weaver").save()
+
+		arnold.acted_in = [terminator, totalrecall, twins]
+		danny.acted_in = [twins]
+
+		actors = Actor.objects.all().prefetch_related("acted_in")
+		movies = Movie.objects.all().prefetch_related("actor_set")
+
+		# Count the statements executed from here on.
+		db = connection.connect()
+		statements = []
+		execute = db.execute
+		def counting_execute(stmt, *args):
+			statements.append(stmt)
+			return execute(stmt, *args)
+		db.execute = counting_execute
+
+		try:
+			self.assert_(list(actors) == [arnold, danny, sigourney])
+			self.assert_(list(movies) == [terminator, totalrecall, twins])
+			self.assert_(len(statements) == 4)
+
+			self.assert_(list(arnold.acted_in) == [terminator, totalrecall, 
+																	twins])
+			self.assert_(list(danny.acted_in) == [twins])
+			self.assert_(not sigourney.acted_in)
+			self.assert_(list(twins.actor_set) == [arnold, danny])
+			self.assert_(terminator.actor_set[0] is arnold)
+			self.assert_(len(statements) == 4)
+
+			sigourney.acted_in.add([terminator])
+			self.assert_(list(sigourney.acted_in) == [terminator])
+			self.assert_(list(terminator.actor_set) == [arnold, sigourney])
+		finally:
+			del db.execute
+
+		self.assertRaises(ValueError, Actor.objects.all().prefetch_related,
+																	"name")
+
+
 if __name__ == "__main__":
 	alltests = (
 		populate,
 		traverse,
 		get_set_delete,
+		prefetch_related,
 	)
 
 	runtests(alltests, verbosity=3)
\ No newline at end of file
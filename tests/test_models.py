@@ -5,9 +5,22 @@
 from utils import Fixture, runtests
 
 from model_examples import Car, Brand, Manufacturer, Driver, Key
-from heinzel.core import models
+from heinzel.core import models, connection
 
-models.register([Manufacturer, Brand, Car, Driver, Key])
+
+class Part(models.Model):
+	number = models.IntegerField(index=True)
+	weight = models.FloatField()
+	car = models.ForeignKeyField(Car)
+
+	class Meta:
+		indexes = (
+			models.Index("car", "weight"),
+			models.Index("weight", where="weight > 100", name="heavy_parts"),
+		)
+
+
+models.register([Manufacturer, Brand, Car, Driver, Key, Part])
 
 
 
@@ -49,9 +62,43 @@ class TestUncache(Fixture):
 
 
 
+class TestIndexes(Fixture):
+	"""syncdb indexes foreign key columns, both column orders of link 
+	tables, fields with index=True and the indexes of a Model's Meta.
+	"""
+
+	def runTest(self):
+		db = connection.connect()
+		indexes = dict(db.execute("SELECT name, sql FROM sqlite_master "
+			"WHERE type = 'index' AND sql IS NOT NULL").fetchall())
+
+		self.assert_("parts__number__idx" in indexes)
+		self.assert_("parts__car_id__weight__idx" in indexes)
+		self.assert_(indexes["heavy_parts"].endswith("WHERE weight > 100"))
+		self.assert_("cars__brand_id__idx" in indexes)
+		self.assert_(
+			"m2m__drivers__cars__cars__cars_id__driver_set_id__idx" in indexes)
+		self.assert_(
+			"m2m__drivers__cars__cars__driver_set_id__cars_id__idx" in indexes)
+
+		def plan(stmt):
+			return " ".join(row[-1] for row in 
+				db.execute("EXPLAIN QUERY PLAN " + stmt).fetchall())
+
+		self.assert_("cars__brand_id__idx" in 
+			plan("SELECT id FROM cars WHERE brand_id = 1"))
+		self.assert_("driver_set_id__cars_id__idx" in plan(
+			"SELECT cars_id FROM m2m__drivers__cars__cars "
+			"WHERE driver_set_id = 1"))
+
+		self.assertRaises(TypeError, models.Index)
+		self.assertRaises(TypeError, models.Index, "weight", partial=True)
+
+
 if __name__ == "__main__":
 	alltests = (
 		TestUncache,
+		TestIndexes,
 	)
 
 	runtests(tests=alltests, verbosity=3)
\ No newline at end of file
@@ -11,7 +11,7 @@ except ImportError, e:
 import pstats
 
 
-from heinzel.core import models
+from heinzel.core import models, connection
 from heinzel.core import exceptions
 from utils import Fixture, runtests, stopwatch
 
@@ -50,8 +50,9 @@ if __name__ == "__main__":
 	n = 10000
 
 	def populate():
-		for i in xrange(n):
-			Actor.objects.create(name="actor_obj_%i" % i)
+		with connection.connect().transaction():
+			for i in xrange(n):
+				Actor.objects.create(name="actor_obj_%i" % i)
 
 	profile.run("populate()", "populate.profile")
 
@@ -7,6 +7,7 @@ from heinzel.core import utils
 
 from model_examples import Actor, Movie, Car, Brand, Manufacturer, Driver, Key
 from heinzel.core import models
+from heinzel.core.sql.dml import compiled_queries, Q
 
 
 models.register([Actor, Movie])
@@ -15,4 +16,82 @@ models.register([Actor, Movie])
 class TestSelectQuery(Fixture):
 	def runTest(self):
 		pass
-		
\ No newline at end of file
+
+
+class CompiledQueries(Fixture):
+	"""
+	Show that:
+	1. Queries differing only in their values share their compiled SQL.
+	2. Queries of different shapes don't.
+	"""
+
+	def runTest(self):
+		for title in ("Alien", "Brazil", "Crash"):
+			Movie(title=title).save()
+
+		compiled_queries.clear()
+
+		q1 = Movie.objects.filter(title="Alien").query
+		q2 = Movie.objects.filter(title="Brazil").query
+		self.assert_(q1.get_shape() == q2.get_shape())
+
+		sql1, values1 = q1.as_sql()
+		sql2, values2 = q2.as_sql()
+		self.assert_(sql1 is sql2)
+		self.assert_(values1 == ["Alien"] and values2 == ["Brazil"])
+		self.assert_(len(compiled_queries) == 1)
+
+		q3 = Movie.objects.filter(title__startswith="A").query
+		self.assert_(q3.get_shape() != q1.get_shape())
+
+		self.assert_([m.title for m in Movie.objects.filter(title="Crash")] 
+						== ["Crash"])
+		self.assert_([m.title for m in Movie.objects.filter(title="Alien")] 
+						== ["Alien"])
+
+		# Limits and offsets are parameters too.
+		qs = Movie.objects.all()
+		self.assert_([m.title for m in qs[0:1]] == ["Alien"])
+		n = len(compiled_queries)
+		self.assert_([m.title for m in qs[1:3]] == ["Brazil", "Crash"])
+		self.assert_(len(compiled_queries) == n)
+
+		# A leaf shared with a query in which it sits elsewhere is bound 
+		# where the compiled SQL of each query expects it.
+		alien = Movie.objects.filter(title__startswith="A")
+		either = alien.filter(Q(title="Brazil") | Q(title="Crash"))
+		sql, values = either.query.as_sql()
+		self.assert_(values == ["A%", "Brazil", "Crash"])
+		self.assert_(alien.query.as_sql()[1] == ["A%"])
+		self.assert_([m.title for m in alien] == ["Alien"])
+		self.assert_(not either)
+		
+
+
+class LongInLists(Fixture):
+	"""
+	Show that:
+	1. IN filters with more values than SQLite takes parameters are passed
+	as one JSON array.
+	2. Many instances can be removed from a many-to-many relation at once.
+	"""
+
+	def runTest(self):
+		movies = Movie.objects.bulk_create(
+			[Movie(title="Movie %i" % i) for i in range(1000)]
+		)
+
+		qs = Movie.objects.filter(pk__in=range(1, 100001))
+		self.assert_("json_each" in qs.query.render())
+		self.assert_(len(qs) == 1000)
+		self.assert_(list(qs) == movies)
+
+		titles = ["Movie %i" % i for i in range(0, 100000, 2)]
+		self.assert_(len(Movie.objects.filter(title__in=titles)) == 500)
+		self.assert_(len(Movie.objects.filter(title__in=titles[:10])) == 10)
+
+		arnold, created = Actor(name="Schwarzenegger").save()
+		arnold.acted_in.add(movies)
+		self.assert_(len(arnold.acted_in) == 1000)
+		arnold.acted_in.remove(movies[1:])
+		self.assert_(list(arnold.acted_in) == movies[:1])
@@ -37,9 +37,45 @@ class GetItemTest(Fixture):
 						== Item.objects.all()[-1:-101:-1])
 
 
+class StreamingTest(Fixture):
+	"""
+	QuerySets are read from the database in chunks, slices are turned
+	into LIMIT/OFFSET clauses.
+	"""
+
+	def runTest(self):
+		for i in xrange(25):
+			Item.objects.create(name="item_nr_%i" % i)
+
+		items = Item.objects.all()
+		it = items.eval()
+		it.chunk_size = 4
+
+		# Other queries may be run while the iteration is suspended.
+		names = []
+		for item in it:
+			names.append(item.name)
+			self.assert_(Item.objects.get(pk=item.pk) is item)
+		self.assert_(names == ["item_nr_%i" % i for i in xrange(25)])
+
+		# Slicing narrows the query instead of loading every row.
+		self.assert_([i.pk for i in items[3:7]] == [4, 5, 6, 7])
+		self.assert_(items[24].name == "item_nr_24")
+		self.assertRaises(IndexError, items.__getitem__, 25)
+		self.assert_(items[30:40] == [])
+		self.assert_([i.pk for i in items[20::2]] == [21, 23, 25])
+
+		# Slices are relative to a limit set on the QuerySet.
+		limited = items.limit(10, 5)
+		self.assert_([i.pk for i in limited[2:20]] == range(8, 16))
+		self.assert_([i.pk for i in limited[:3]] == [6, 7, 8])
+		self.assert_(limited[-1].pk == 15)
+
+
 if __name__ == "__main__":
 	alltests = (
 		GetItemTest,
+		StreamingTest,
 	)
 
 
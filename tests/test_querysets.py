@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 
+import sqlite3
+
 from utils import Fixture, runtests
 from heinzel.core.exceptions import DoesNotExist, SQLSyntaxError
 from heinzel.core import utils
@@ -8,13 +10,15 @@ from heinzel.core import utils
 from model_examples import (
 	Actor, Movie, Car, Brand, Manufacturer, Driver, Key, Item
 )
-from heinzel.core.sql.dml import (Avg, Max, Min, Count, Sum)
-from heinzel.core import models
+from heinzel.core.sql import dml
+from heinzel.core.sql.dml import (Avg, Max, Min, Count, Sum, Q)
+from heinzel.core import models, connection
 
 
 models.register([Actor, Movie, Item])
 
 from heinzel.core.queries import storage as store
+from heinzel.core.info import get_inst_info
 
 
 
@@ -346,10 +350,361 @@ class Distinct(Fixture):
 				== [{"title": "Some Movie"}, {"title": "Some other movie"}])
 
 
+class CountingRows(Fixture):
+	"""
+	Show that:
+	1. Querysets are counted and probed for rows by the database, without
+	loading any instances.
+	"""
+
+	def runTest(self):
+		soap, created = Item.objects.create(name="Super Soap", price=0.99, stock=100)
+		beer, created = Item.objects.create(name="Pilsener", price=0.89, stock=100000)
+
+		db = connection.connect()
+		db.execute("INSERT INTO %s (name, price, stock) VALUES ('Salt', 0.5, 7)"
+					% Item.tablename())
+		db.commit()
+		alive = len(store._alive)
+
+		items = Item.objects.all()
+		self.assert_(items.count() == len(items) == 3)
+		self.assert_(items.filter(price__lt=0.95).count() == 2)
+		self.assert_(items.filter(stock__lt=50).exists())
+		self.assert_(items.filter(stock__lt=50))
+		self.assert_(not items.filter(stock__lt=5))
+		self.assert_(soap in items and soap not in items.filter(stock=7))
+		self.assert_(len(store._alive) == alive)
+
+		# Limits and distinct are applied before counting.
+		self.assert_(len(items.limit(2)) == 2)
+		self.assert_(len(items.limit(2, 2)) == 1)
+		self.assert_(not items.limit(2, 3).exists())
+		self.assert_(len(items.distinct()) == 3)
+
+		# Unsaved instances count as well.
+		cukes = Item(name="Cucumbers", price=1.69, stock=30)
+		self.assert_(len(items) == 4)
+		self.assert_(cukes in items)
+
+		# Counting values of a column
+		self.assert_(items.count("price") == 4)
+
+
+class ResultCache(Fixture):
+	"""
+	Show that:
+	1. An evaluated QuerySet keeps its results until instances of its model
+	change.
+	2. QuerySet.iterator streams results without caching them.
+	"""
+
+	def runTest(self):
+		soap, created = Item.objects.create(name="Super Soap", price=0.99, stock=100)
+		beer, created = Item.objects.create(name="Pilsener", price=0.89, stock=100000)
+
+		items = Item.objects.all()
+		self.assert_(list(items) == [soap, beer])
+
+		# A row the store doesn't know about.
+		db = connection.connect()
+		db.execute("INSERT INTO %s (name, price, stock) VALUES ('Salt', 0.5, 7)"
+					% Item.tablename())
+		db.commit()
+
+		# Iterating, indexing, len, bool and 'in' read the cached results.
+		self.assert_(list(items) == [soap, beer])
+		self.assert_(items[-1] is beer)
+		self.assert_(len(items) == 2 and items and soap in items)
+
+		self.assert_(len(list(items.iterator())) == 3)
+		self.assert_(len(list(items.filter(stock__gt=0))) == 3)
+		self.assert_(len(items) == 2)
+
+		# Changing an instance of the model invalidates the results.
+		beer.stock = 99999
+		self.assert_(len(items) == 3)
+		self.assert_(items[-1].name == "Salt")
+
+
+class KeysetPagination(Fixture):
+	"""
+	Show that:
+	1. QuerySet.page_after pages through a QuerySet in its ordering, 
+	seeking to the row after the last one seen instead of skipping rows.
+	"""
+
+	def runTest(self):
+		for i in range(11):
+			Item(name="Item %02i" % i, price=float(i % 3), stock=i % 4).save()
+
+		def pages(qs, size):
+			result = []
+			page = list(qs.page_after(None, size))
+			while page:
+				self.assert_(len(page) <= size)
+				result.extend(page)
+				page = list(qs.page_after(page[-1], size))
+			return result
+
+		items = Item.objects.all()
+		self.assert_(pages(items, 3) == list(items))
+
+		# Rows of equal price are ordered by their primary key.
+		by_price = items.orderby("-price")
+		ordered = sorted(items, key=lambda i: (-i.price, -i.pk))
+		self.assert_(pages(by_price, 2) == ordered)
+
+		# Ordered in different directions
+		mixed = items.orderby("-stock").orderby("name")
+		self.assert_(pages(mixed, 4) == list(mixed))
+
+		last = ordered[4]
+		qs = by_price.seek(price=last.price, pk=last.pk)
+		self.assert_(list(qs) == ordered[5:])
+		self.assert_(qs.query.get_values()["heinzel_seek_1"] == last.pk)
+		self.assertRaises(ValueError, by_price.seek, price=1.0)
+
+
+class ValuesList(Fixture):
+	"""
+	Show that:
+	1. QuerySet.values_list yields tuples of column values, no instances.
+	"""
+
+	def runTest(self):
+		soap, created = Item.objects.create(name="Super Soap", price=0.99, stock=100)
+		beer, created = Item.objects.create(name="Pilsener", price=0.89, stock=100000)
+		salt = Item(name="Salt", price=0.5, stock=7)
+
+		items = Item.objects.all().orderby("name")
+		self.assert_(list(items.values_list("name", "stock")) == 
+				[("Pilsener", 100000), ("Salt", 7), ("Super Soap", 100)])
+		self.assert_(list(items.filter(stock__lt=50).values_list("name", 
+											flat=True)) == ["Salt"])
+
+		rows = list(items.values_list("name", "price", named=True))
+		self.assert_(rows[0].name == "Pilsener" and rows[0].price == 0.89)
+
+		row = list(items.filter(name="Salt").values_list())[0]
+		self.assert_(len(row) == len(Item.get_column_names()) 
+						and salt.pk in row and "Salt" in row)
+
+		self.assertRaises(TypeError, items.values_list, "name", "price", 
+																flat=True)
+		self.assertRaises(TypeError, items.values_list, "name", flatten=True)
+
+
+class DeferredColumns(Fixture):
+	"""
+	Show that:
+	1. Columns left out by QuerySet.defer and QuerySet.only are loaded on 
+	first access, for all instances of the QuerySet with one query.
+	"""
+
+	def runTest(self):
+		for name in ("Super Soap", "Pilsener", "Salt"):
+			Item(name=name, price=0.99, stock=100).save()
+		store.clear()
+
+		db = connection.connect()
+		statements = []
+		execute = db.execute
+		def counting_execute(stmt, *args):
+			statements.append(stmt)
+			return execute(stmt, *args)
+		db.execute = counting_execute
+
+		try:
+			items = list(Item.objects.all().defer("name", "stock"))
+			self.assert_("name" not in statements[-1])
+			self.assert_(len(statements) == 1)
+
+			items[1].stock = 50
+			self.assert_([i.name for i in items] == 
+									["Super Soap", "Pilsener", "Salt"])
+			self.assert_([i.price for i in items] == [0.99] * 3)
+			self.assert_(len(statements) == 2)
+			self.assert_([i.stock for i in items] == [100, 50, 100])
+			self.assert_(len(statements) == 2)
+
+			salt = Item.objects.all().only("name")[2]
+			self.assert_(salt is items[2])
+			self.assert_(salt.price == 0.99)
+
+			# A deferred column set to None is saved as well.
+			del items, salt
+			store.clear()
+			items = list(Item.objects.all().defer("stock"))
+			self.assert_("stock" in get_inst_info(items[0])._deferred)
+			items[0].stock = None
+			items[0].save()
+			self.assert_(Item.objects.get(name="Super Soap").stock is None)
+
+			# Without change tracking, deferred columns not loaded are not
+			# written.
+			salt = items[2]
+			salt.uncache()
+			salt.price = 0.5
+			salt.save()
+			self.assert_(list(Item.objects.filter(name="Salt")
+				.values_list("price", "stock")) == [(0.5, 100)])
+		finally:
+			del db.execute
+
+		self.assertRaises(ValueError, Item.objects.all().defer, "colour")
+
+
+class UpdateAndDelete(Fixture):
+	"""
+	Show that:
+	1. QuerySet.update and QuerySet.delete change all rows of a QuerySet with
+	one statement, and the instances in memory along with them.
+	"""
+
+	def runTest(self):
+		soap, created = Item.objects.create(name="Super Soap", price=0.99, stock=100)
+		beer, created = Item.objects.create(name="Pilsener", price=0.89, stock=100000)
+		salt = Item(name="Salt", price=0.5, stock=7)
+
+		cheap = Item.objects.filter(price__lt=0.95)
+		self.assert_(cheap.update(stock=0) == 2)
+		self.assert_(beer.stock == salt.stock == 0 and soap.stock == 100)
+		self.assert_(not store._dirty)
+
+		self.assert_(list(Item.objects.all().orderby("name")
+			.values_list("stock", flat=True)) == [0, 0, 100])
+		self.assertRaises(ValueError, cheap.update, colour="blue")
+
+		self.assert_(Item.objects.filter(stock=0).limit(1).delete() == 1)
+		self.assert_(beer.pk is None and salt.pk is not None)
+		self.assert_(Item.objects.all().delete() == 2)
+		self.assert_(soap.pk is salt.pk is None)
+		self.assert_(not Item.objects.all())
+
+
+class Upsert(Fixture):
+	"""
+	Show that:
+	1. Manager.upsert inserts a row or updates the row with the same values
+	of the unique fields, and tells which one it did.
+	2. Columns not passed to Manager.upsert keep their values.
+	3. Manager.bulk_upsert does the same for many instances and sets their
+	primary keys.
+	4. Both return the instances in memory of updated rows.
+	"""
+
+	def runTest(self):
+		soap, created = Item.objects.upsert(name="Super Soap", price=0.99, stock=100)
+		self.assert_(created and soap.pk is not None)
+
+		same, created = Item.objects.upsert(name="Super Soap", price=1.49, stock=80)
+		self.assert_(not created and same is soap)
+		self.assert_(soap.price == 1.49 and soap.stock == 80)
+		self.assert_(not store._dirty)
+		self.assert_(Item.objects.all().count() == 1)
+		self.assert_(list(Item.objects.all().values_list("price", flat=True)) == [1.49])
+
+		same, created = Item.objects.upsert(name="Super Soap", price=2.0)
+		self.assert_(not created and same is soap)
+		self.assert_(soap.price == 2.0 and soap.stock == 80)
+		self.assert_(list(Item.objects.all().values_list("price", "stock")) == [(2.0, 80)])
+
+		same, created = Item.objects.upsert(name="Super Soap")
+		self.assert_(not created and same is soap and soap.price == 2.0)
+
+		# Without UPDATE ... RETURNING, the row is looked up afterwards.
+		returning, dml.HAS_RETURNING = dml.HAS_RETURNING, False
+		try:
+			same, created = Item.objects.upsert(name="Super Soap", stock=70)
+		finally:
+			dml.HAS_RETURNING = returning
+		self.assert_(not created and same is soap and soap.stock == 70)
+
+		self.assertRaises(ValueError, Item.objects.upsert, 
+			conflict_fields=["colour"], name="Salt")
+		self.assertRaises(ValueError, Movie.objects.upsert, title="Brazil")
+		self.assertRaises(ValueError, Item.objects.upsert, 
+			conflict_fields=["price"], name="Salt", price=0.5)
+		self.assertRaises(ValueError, Movie.objects.upsert, 
+			conflict_fields=["title"], title="Heat")
+		self.assert_(not store._dirty)
+
+		# An instance that failed to be upserted is not saved later on.
+		def fail(query):
+			raise sqlite3.OperationalError("disk I/O error")
+		execute, dml.UpsertQuery.execute = dml.UpsertQuery.execute, fail
+		try:
+			self.assertRaises(sqlite3.OperationalError, Item.objects.upsert, 
+				name="Salt", price=0.5)
+		finally:
+			dml.UpsertQuery.execute = execute
+		self.assert_(not store._dirty)
+		self.assert_(Item.objects.all().count() == 1)
+
+		items = [
+			Item(name="Super Soap", price=0.99, stock=100),
+			Item(name="Pilsener", price=0.89, stock=100000),
+		]
+		upserted = Item.objects.bulk_upsert(items, batch_size=1)
+		self.assert_(upserted[0] is soap and upserted[1] is items[1])
+		self.assert_(soap.price == 0.99 and soap.stock == 100)
+		self.assert_(items[1].pk not in (None, soap.pk))
+		self.assert_(Item.objects.get(name="Super Soap") is soap)
+		self.assert_(Item.objects.get(name="Pilsener") is items[1])
+		self.assert_(not store._dirty)
+		self.assert_(list(Item.objects.all().orderby("name")
+			.values_list("name", "price")) == [("Pilsener", 0.89), ("Super Soap", 0.99)])
+
+		self.assertRaises(ValueError, Item.objects.bulk_upsert, [Item(price=1.0)])
+
+
 class Reset(Fixture):
 	pass
 
 
+class Clone(Fixture):
+	"""
+	Show that:
+	1. Chained querysets share the leaves of their predecessors.
+	2. Changing a chained queryset leaves its predecessors unchanged.
+	3. A shared leaf names its parameters after its position in the query
+	rendering it.
+	"""
+
+	def runTest(self):
+		soap, created = Item.objects.create(name="Super Soap", price=0.99, stock=100)
+		beer, created = Item.objects.create(name="Pilsener", price=0.89, stock=100000)
+		cukes, created = Item.objects.create(name="Cucumbers", price=1.69, stock=30)
+
+		cheap = Item.objects.filter(price__lt=1.0)
+		plenty = cheap.filter(stock__gt=50)
+		ordered = plenty.orderby("name")
+		reversed_ = ordered.orderby("name")
+
+		cheap_leaves = utils.recurse(cheap.query.where_node)
+		plenty_leaves = utils.recurse(plenty.query.where_node)
+		self.assert_(len(cheap_leaves) == 1 and len(plenty_leaves) == 2)
+		self.assert_([l for l in plenty_leaves if l is cheap_leaves[0]])
+
+		self.assert_(list(cheap) == [soap, beer])
+		self.assert_(list(plenty.limit(1)) == [soap])
+		self.assert_(list(plenty) == [soap, beer])
+		self.assert_(list(ordered) == [beer, soap])
+		self.assert_(list(reversed_) == [soap, beer])
+		self.assert_(list(ordered) == [beer, soap])
+
+		# The leaf of cheap comes after the leaves of the OR in either.
+		either = cheap.filter(Q(name="Pilsener") | Q(name="Cucumbers"))
+		sql = cheap.query.render()
+		either_sql = either.query.render()
+		self.assert_(":p0_0" in sql and ":p2_0" in either_sql)
+		self.assert_(cheap.query.render() == sql)
+		self.assert_(cheap.query.get_values() == {"p0_0": 1.0})
+		self.assert_(list(either) == [beer])
+		self.assert_(list(cheap) == [soap, beer])
+
+
 
 
 if __name__ == "__main__":
@@ -364,10 +719,17 @@ if __name__ == "__main__":
 		Limit,
 		Select,
 		Distinct,
+		CountingRows,
+		ResultCache,
+		KeysetPagination,
+		ValuesList,
+		DeferredColumns,
+		UpdateAndDelete,
+		Upsert,
 		# Reset,
 		# Raw,
 		# AsDict,
-		# Clone
+		Clone,
 	)
 
 	runtests(alltests, verbosity=3)
@@ -6,12 +6,12 @@ from heinzel.core.exceptions import DoesNotExist, DatabaseSanityError
 from heinzel.core import utils
 
 from model_examples import (Actor, Movie, UniqueTitleMovie, Car, Brand,
-	Manufacturer, Driver, Key)
+	Manufacturer, Driver, Key, Item)
 
-from heinzel.core import models
+from heinzel.core import models, connection
 
 
-models.register([Actor, Movie, UniqueTitleMovie])
+models.register([Actor, Movie, UniqueTitleMovie, Item])
 
 
 # only imported for verifying QuerySet results
@@ -156,6 +156,110 @@ class DeletingInstances(Fixture):
 		self.assertRaises(DoesNotExist, Movie.objects.get, **{"title": "Magnolia"})
 
 
+class LoadingInstances(Fixture):
+	"""
+	Show that:
+	1. Rows loaded from the database become instances without going through
+	‘‘Model.__init__‘‘, but behave like any other instance.
+	"""
+
+	def runTest(self):
+		from heinzel.core import connection
+		db = connection.connect()
+		db.executemany("INSERT INTO movies (id, title) VALUES (null, ?)",
+						[("Movie %i" % i,) for i in xrange(10)])
+		db.commit()
+
+		inits = []
+		Movie.__init__ = lambda self, **kwargs: inits.append(self)
+		try:
+			movies = list(Movie.objects.all())
+		finally:
+			del Movie.__init__
+
+		self.assert_(not inits)
+
+		self.assert_([m.title for m in movies]
+						== [u"Movie %i" % i for i in xrange(10)])
+
+		inf = get_inst_info(movies[0])
+		self.assert_(inf._vars == {"id": 1, "title": u"Movie 0"})
+
+		# The instances are registered with the store ...
+		self.assert_(store._alive[(Movie, 1)] is inf)
+		self.assert_(store._cache._instances[inf] is movies[0])
+		self.assert_(not store._dirty)
+
+		# ... and are found again by other queries.
+		self.assert_(Movie.objects.get(title="Movie 3") is movies[3])
+
+		# Changes are tracked.
+		movies[3].title = "Movie three"
+		self.assert_(store._dirty[get_inst_info(movies[3])] is movies[3])
+		movies[3].save()
+		self.assert_(Movie.objects.filter(title="Movie three").select("id")
+						== [{"id": 4}])
+
+
+class FlushingDirtyInstances(Fixture):
+	"""
+	Show that:
+	1. Before a query is run, only the dirty instances of the models it
+	reads are saved.
+	"""
+
+	def runTest(self):
+		akira = Movie(title="Akira")
+		ghosts = Movie(title="Ghost Rider")
+		cage = Actor(name="Cage")
+
+		self.assert_(list(Movie.objects.all()) == [akira, ghosts]
+					or list(Movie.objects.all()) == [ghosts, akira])
+		self.assert_(set([akira.pk, ghosts.pk]) == set([1, 2]))
+
+		# Movies were saved and are no longer dirty, the actor is untouched.
+		self.assert_(store._dirty.values() == [cage])
+		self.assert_(cage.pk is None)
+
+		akira.title = "AKIRA"
+		self.assert_(list(Actor.objects.all()) == [cage])
+		self.assert_(cage.pk == 1)
+
+		# Unrelated to the actor query, so still dirty.
+		self.assert_(store._dirty.values() == [akira])
+		db = connection.connect()
+		self.assert_(db.execute("SELECT title FROM movies WHERE id=?", 
+			(akira.pk,)).fetchall() == [("Akira",)])
+
+		self.assert_(Movie.objects.get(title="AKIRA") is akira)
+		self.assert_(not store._dirty)
+
+
+class BulkCreatingInstances(Fixture):
+	"""
+	Show that:
+	1. Bulk created instances get the ids of their rows.
+	2. They are registered with the store like saved instances.
+	"""
+
+	def runTest(self):
+		movies = [Movie(title="Movie %s" % i) for i in xrange(25)]
+		movies.append(Movie(id=100, title="Movie 100"))
+
+		self.assert_(Movie.objects.bulk_create(movies, batch_size=10) 
+						== movies)
+		# Rows with explicit ids are inserted first.
+		self.assert_([m.pk for m in movies] == range(101, 126) + [100])
+		self.assert_(not store._dirty)
+
+		self.assert_(Movie.objects.get(title="Movie 4") is movies[4])
+		self.assert_(Movie.objects.get(id=100) is movies[-1])
+		self.assert_(len(Movie.objects.all()) == 26)
+
+		self.assertRaises(TypeError, Movie.objects.bulk_create, 
+							[Actor(name="Cage")])
+
+
 class InstancesAreIdentical(Fixture):
 	"""
 	Show that:
@@ -242,9 +346,36 @@ class SavedObjectsHistoryDeleted(Fixture):
 	"""
 	Show that:
 	1. When an object is saved, it's change history will be deleted.
+	2. Only changed columns are written on saving.
+	3. Saving an object without changes does not touch the database.
 	"""
 	
-	def runTest(self): pass
+	def runTest(self):
+		db = connection.connect()
+		pen = Item(name="pen", price=1.5, stock=10)
+		pen.save()
+
+		inf = get_inst_info(pen)
+		self.assert_(inf.get_changed_columns() == [])
+
+		pen.stock = 9
+		pen.stock = 8
+		self.assert_(inf.get_changed_columns() == ["stock"])
+
+		db.execute("UPDATE %s SET price=2.0" % Item.tablename())
+		db.commit()
+
+		pen.save()
+		self.assert_(inf.get_changed_columns() == [])
+		self.assert_(db.execute("SELECT price, stock FROM %s" 
+			% Item.tablename()).fetchall() == [(2.0, 8)])
+
+		# Setting a field back to its saved value is no change.
+		pen.stock = 7
+		pen.stock = 8
+		changes = db.conn.total_changes
+		pen.save()
+		self.assert_(db.conn.total_changes == changes)
 
 
 
@@ -253,8 +384,12 @@ if __name__ == "__main__":
 	alltests = (
 		BasicAssumptions,
 		SavingInstances,
+		LoadingInstances,
+		FlushingDirtyInstances,
+		BulkCreatingInstances,
 		DeletingInstances,
 		InstancesAreIdentical,
+		SavedObjectsHistoryDeleted,
 	)
 
 	runtests(alltests, verbosity=3)
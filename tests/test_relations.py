@@ -46,6 +46,7 @@ the primary model where it is defined.
 """
 
 import unittest, os
+import sqlite3
 
 from heinzel.core import models
 from heinzel.core import exceptions
@@ -216,9 +217,50 @@ class GrandUnifiedRelationsTest(Fixture):
 
 
 
+class ForeignKeyConstraints(GrandUnifiedRelationsTest):
+	"""The same relations, their integrity being enforced by foreign key 
+	constraints instead of triggers.
+	"""
+
+	def setUp(self):
+		from heinzel.maintenance import syncdb
+		from heinzel import settings
+
+		if os.path.exists(os.path.abspath(settings.DBNAME)):
+			os.remove(settings.DBNAME)
+
+		syncdb(models.registry, settings.DBNAME, integrity="foreign_keys")
+
+	def runTest(self):
+		from heinzel.core import connection
+		db = connection.connect()
+
+		self.assert_(not db.execute("SELECT name FROM sqlite_master "
+			"WHERE type = 'trigger'").fetchall())
+
+		GrandUnifiedRelationsTest.runTest(self)
+
+		party = Party.objects.get(name="The visitor's to the Duke")
+		herman = Character.objects.get(firstname="Herrmann")
+		links = ("SELECT COUNT(*) FROM m2m__characters__member_of__partys "
+			"WHERE member_of_id = ?")
+		self.assert_(db.execute(links, (party.id,)).fetchone()[0] == 3)
+
+		# Links are unique and go away with the rows they link.
+		self.assertRaises(sqlite3.IntegrityError, db.conn.execute, 
+			"INSERT INTO m2m__characters__member_of__partys VALUES "
+			"(null, ?, ?)", (party.id, herman.id))
+		self.assertRaises(sqlite3.IntegrityError, db.conn.execute, 
+			"INSERT INTO m2m__characters__member_of__partys VALUES "
+			"(null, ?, ?)", (party.id + 1, herman.id))
+		db.execute("DELETE FROM partys WHERE id = ?", (party.id,))
+		self.assert_(db.execute(links, (party.id,)).fetchone()[0] == 0)
+
+
 if __name__ == "__main__":
 	alltests = (
 		GrandUnifiedRelationsTest,
+		ForeignKeyConstraints,
 	)
 
 	runtests(tests=alltests, verbosity=3)
\ No newline at end of file
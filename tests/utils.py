@@ -29,6 +29,11 @@ class Fixture(unittest.TestCase):
 		from heinzel.core import connection
 		conn = connection.connect()
 		conn.close()
+		# The databases left idle by other threads would still use the 
+		# removed file.
+		for db in connection.pool._idle:
+			if db.conn is not None:
+				db.close()
 
 	def closeCache(self):
 		from heinzel.core.queries import storage